@@ -0,0 +1,415 @@
+"""Offline load test for the roll, stats and delete interaction paths.
+
+Drives the real button callbacks with fake Discord interactions, so no gateway
+connection or bot token is needed. By default db.operations is backed by an
+in-memory stand-in with a simulated per-query latency; pass --dsn to run the
+real queries against a local Postgres instead.
+
+    python -m bench.interactions --users 200 --buttons 5 --clicks 3 --output bench.json
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import math
+import random
+import sys
+import time
+import uuid
+
+
+class Counters:
+    def __init__(self):
+        self.db_round_trips = 0
+        self.rest_calls = 0
+        self.interaction_responses = 0
+
+
+counters = Counters()
+
+
+# --- Fake Discord objects --------------------------------------------------
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.display_name = f"user{user_id}"
+
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def _respond(self):
+        counters.interaction_responses += 1
+        self.done = True
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+    async def send_message(self, *args, **kwargs):
+        await self._respond()
+
+    async def edit_message(self, **kwargs):
+        await self._respond()
+
+    async def send_modal(self, modal):
+        await self._respond()
+
+
+class FakeMessage:
+    def __init__(self, message_id, channel, rest_latency):
+        self.id = message_id
+        self.channel = channel
+        self.rest_latency = rest_latency
+        self.content = None
+
+    async def edit(self, content=None, **kwargs):
+        counters.rest_calls += 1
+        await asyncio.sleep(self.rest_latency)
+        if content is not None:
+            self.content = content
+        return self
+
+
+class FakeChannel:
+    def __init__(self, channel_id, rest_latency):
+        self.id = channel_id
+        self.rest_latency = rest_latency
+        self.messages = {}
+
+    def get_partial_message(self, message_id):
+        message = self.messages.get(message_id)
+        if message is None:
+            message = self.messages[message_id] = FakeMessage(message_id, self, self.rest_latency)
+        return message
+
+
+class FakeClient:
+    def __init__(self, channel):
+        self.channel = channel
+
+    def get_partial_messageable(self, channel_id):
+        return self.channel
+
+
+class FakeFollowup:
+    async def send(self, *args, **kwargs):
+        counters.rest_calls += 1
+
+
+class FakeInteraction:
+    def __init__(self, user, message, client):
+        self.user = user
+        self.message = message
+        self.client = client
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+        self.extras = {}
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+
+    async def edit_original_response(self, **kwargs):
+        counters.rest_calls += 1
+
+    async def original_response(self):
+        return self.message
+
+
+# --- In-memory stand-in for db.operations ----------------------------------
+
+class MemoryDatabase:
+    """Implements the db.operations queries the interaction paths use.
+
+    Every call that the real module answers from Postgres counts as one round
+    trip and sleeps for the configured latency; roll cache hits stay free.
+    """
+    OPERATIONS = (
+        "insert_roll", "insert_roll_and_get_rolls", "get_rolls", "get_roll_stats",
+        "get_recent_rolls", "get_rolls_page", "delete_roll_and_get_state",
+        "get_button_id_by_message", "save_button_message", "is_button_open",
+    )
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.rolls = {}  # str(button_id) -> list of roll dicts in insert order
+        self.messages = {}  # str(button_id) -> (channel_id, message_id)
+        self.ids = itertools.count(1)
+
+    def install(self):
+        import db.operations
+        for name in self.OPERATIONS:
+            setattr(db.operations, name, getattr(self, name))
+
+    async def _round_trip(self):
+        counters.db_round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _insert(self, button_id, user_id, user_display_name, roll):
+        rolls = self.rolls.setdefault(str(button_id), [])
+        if any(r["user_id"] == user_id for r in rolls):
+            return None
+        row = {
+            "id": next(self.ids),
+            "user_id": user_id,
+            "user_display_name": user_display_name,
+            "roll": roll,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc)
+        }
+        rolls.append(row)
+        return dict(row)
+
+    async def save_button_message(self, button_id, channel_id, message_id):
+        await self._round_trip()
+        self.messages[str(button_id)] = (channel_id, message_id)
+
+    async def get_button_id_by_message(self, message_id):
+        await self._round_trip()
+        for button_id, (_, stored_id) in self.messages.items():
+            if stored_id == message_id:
+                return uuid.UUID(button_id)
+        return None
+
+    async def is_button_open(self, button_id):
+        await self._round_trip()
+        return str(button_id) in self.messages
+
+    async def insert_roll(self, button_id, user_id, user_display_name, roll):
+        await self._round_trip()
+        return self._insert(button_id, user_id, user_display_name, roll)
+
+    async def insert_roll_and_get_rolls(self, button_id, user_id, user_display_name, roll):
+        await self._round_trip()
+        inserted = self._insert(button_id, user_id, user_display_name, roll)
+        return inserted, [dict(r) for r in self.rolls.get(str(button_id), [])]
+
+    async def get_rolls(self, button_id):
+        from db.cache import roll_cache
+        cached = roll_cache.get(button_id)
+        if cached is not None:
+            return cached
+        await self._round_trip()
+        roll_cache.set(button_id, self.rolls.get(str(button_id), []))
+        return roll_cache.get(button_id)
+
+    async def get_roll_stats(self, button_id):
+        await self._round_trip()
+        rolls = self.rolls.get(str(button_id), [])
+        channel_id, message_id = self.messages.get(str(button_id), (None, None))
+        values = [r["roll"] for r in rolls]
+        return {
+            "total_rolls": len(values),
+            "average_roll": round(sum(values) / len(values)) if values else 0,
+            "highest_roll": max(values) if values else None,
+            "lowest_roll": min(values) if values else None,
+            "latest_roll_at": rolls[-1]["timestamp"] if rolls else None,
+            "channel_id": channel_id,
+            "message_id": message_id
+        }
+
+    async def get_recent_rolls(self, button_id, limit):
+        await self._round_trip()
+        return [dict(r) for r in self.rolls.get(str(button_id), [])[-limit:]]
+
+    async def get_rolls_page(self, button_id, limit, after=None, before=None, search=None):
+        await self._round_trip()
+        rolls = self.rolls.get(str(button_id), [])
+        if search:
+            rolls = [r for r in rolls if search.lower() in r["user_display_name"].lower()]
+        if after:
+            rolls = [r for r in rolls if (r["timestamp"], r["id"]) > after]
+        elif before:
+            rolls = [r for r in rolls if (r["timestamp"], r["id"]) < before][::-1]
+        page = [dict(r) for r in rolls[:limit]]
+        if before:
+            page.reverse()
+        return page, len(rolls) > limit
+
+    async def delete_roll_and_get_state(self, button_id, user_id):
+        from db.cache import roll_cache
+        await self._round_trip()
+        key = str(button_id)
+        rolls = self.rolls.get(key, [])
+        remaining = [r for r in rolls if r["user_id"] != user_id]
+        self.rolls[key] = remaining
+        roll_cache.set(button_id, remaining)
+        channel_id, message_id = self.messages.get(key, (None, None))
+        return {
+            "deleted": len(remaining) != len(rolls),
+            "channel_id": channel_id,
+            "message_id": message_id,
+            "is_open": key in self.messages,
+            "rolls": [dict(r) for r in remaining]
+        }
+
+
+class CountingPool:
+    """Wraps an asyncpg pool so every acquisition counts as a round trip"""
+    def __init__(self, pool):
+        self.pool = pool
+
+    def acquire(self, *args, **kwargs):
+        counters.db_round_trips += 1
+        return self.pool.acquire(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+
+async def connect_postgres(dsn):
+    import db.connection
+
+    pool = await db.connection.create_db_pool(dsn)
+    db.connection.db_pool = CountingPool(pool)
+    return pool
+
+
+# --- Load generation --------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else None,
+        "p50_ms": round(percentile(values, 50) * 1000, 3) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 3) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 3) if values else None,
+    }
+
+
+async def run(args):
+    from ui.roll_button import RollDynamicButton, StatsDynamicButton
+    from ui.admin_buttons import perform_delete
+    from utils.edit_scheduler import edit_scheduler
+    from db.batch_writer import roll_writer
+    from utils.button_actors import roll_actors
+    from db.journal import roll_journal
+    import db.operations
+    from utils.startup import startup
+
+    startup.db_ready.set()
+    if args.dsn:
+        pool = await connect_postgres(args.dsn)
+    else:
+        pool = None
+        MemoryDatabase(args.db_latency_ms / 1000).install()
+
+    rng = random.Random(args.seed)
+    channel = FakeChannel(1, args.rest_latency_ms / 1000)
+    client = FakeClient(channel)
+    buttons = []
+    for i in range(args.buttons):
+        button_id = uuid.uuid4()
+        message_id = 1000 + i
+        await db.operations.save_button_message(button_id, channel.id, message_id)
+        buttons.append((button_id, channel.get_partial_message(message_id)))
+
+    counters.db_round_trips = 0
+    counters.rest_calls = 0
+    counters.interaction_responses = 0
+    latencies = {"roll": [], "stats": [], "delete": []}
+    errors = {"roll": 0, "stats": 0, "delete": 0}
+
+    async def click(kind, user, button_id, message):
+        interaction = FakeInteraction(user, message, client)
+        start = time.perf_counter()
+        try:
+            if kind == "roll":
+                await RollDynamicButton(button_id).callback(interaction)
+            elif kind == "stats":
+                await StatsDynamicButton(button_id).callback(interaction)
+            else:
+                result = await perform_delete(interaction, button_id, user.id, user.display_name)
+                # A user without a roll has nothing to delete; that's not an error
+                if result is None or result[1] is False:
+                    raise RuntimeError(f"perform_delete returned {result}")
+        except Exception as e:
+            errors[kind] += 1
+            print(f"{kind} click failed: {e!r}", file=sys.stderr)
+            return
+        latencies[kind].append(time.perf_counter() - start)
+
+    async def user_session(user_id):
+        user = FakeUser(user_id)
+        for _ in range(args.clicks):
+            button_id, message = rng.choice(buttons)
+            draw = rng.random()
+            kind = "roll" if draw < args.roll_ratio else "stats" if draw < args.roll_ratio + args.stats_ratio else "delete"
+            await click(kind, user, button_id, message)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(10_000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    # Let pending coalesced edits land so their REST calls are counted
+    while edit_scheduler.workers:
+        await asyncio.gather(*edit_scheduler.workers.values(), return_exceptions=True)
+
+    # Roll clicks don't wait for their edit, so its failures only show up here
+    errors["edit"] = edit_scheduler.failed
+
+    clicks = sum(len(v) for v in latencies.values())
+    result = {
+        "config": vars(args),
+        "backend": "postgres" if args.dsn else "memory",
+        "elapsed_s": round(elapsed, 3),
+        "clicks": clicks,
+        "clicks_per_second": round(clicks / elapsed, 1) if elapsed else None,
+        "db_round_trips_per_click": round(counters.db_round_trips / clicks, 3) if clicks else None,
+        "rest_calls_per_click": round(counters.rest_calls / clicks, 3) if clicks else None,
+        "interaction_responses": counters.interaction_responses,
+        "errors": errors,
+        "latency": {kind: summarize(values) for kind, values in latencies.items()},
+        "edits": edit_scheduler.get_stats(),
+        "batch_writer": roll_writer.get_stats() if roll_writer else None,
+        "actors": roll_actors.get_stats(),
+        "journal": roll_journal.get_stats() if roll_journal else None,
+    }
+
+    if pool is not None:
+        await pool.close()
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the roll button interaction paths offline")
+    parser.add_argument("--users", type=int, default=100, help="concurrent simulated users")
+    parser.add_argument("--buttons", type=int, default=5, help="roll buttons the users click on")
+    parser.add_argument("--clicks", type=int, default=3, help="clicks per user")
+    parser.add_argument("--roll-ratio", type=float, default=0.8, help="share of clicks that roll")
+    parser.add_argument("--stats-ratio", type=float, default=0.15, help="share of clicks on the stats button; the rest delete")
+    parser.add_argument("--db-latency-ms", type=float, default=1.0, help="simulated query latency for the in-memory backend")
+    parser.add_argument("--rest-latency-ms", type=float, default=50.0, help="simulated latency of a Discord REST edit")
+    parser.add_argument("--dsn", help="run against this Postgres instead of the in-memory backend")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    report = json.dumps(result, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+        print(f"Wrote {args.output}: {result['clicks_per_second']} clicks/s, "
+              f"roll p99 {result['latency']['roll']['p99_ms']} ms")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,4 +18,103 @@ AUTHORIZED_ADMIN_IDS = [admin_id for admin_id in AUTHORIZED_ADMIN_IDS if admin_i
 
 # Rate limiting constants
 RATE_LIMIT_RESET_TIME = 1  # seconds - Discord rate limits are typically per-second
-MAX_OPERATIONS_PER_SECOND = 45  # Discord allows 50/s but we'll keep a small buffer
\ No newline at end of file
+MAX_OPERATIONS_PER_SECOND = 45  # Discord allows 50/s but we'll keep a small buffer
+
+# Roll cache - number of buttons whose roll lists are kept in memory
+ROLL_CACHE_SIZE = int(os.getenv("ROLL_CACHE_SIZE", "512"))
+
+# Public roll messages are re-rendered at most once per interval (seconds)
+EDIT_COALESCE_INTERVAL = float(os.getenv("EDIT_COALESCE_INTERVAL", "1.0"))
+
+# Startup check of stored button messages - how many recent ones, how many at once
+VIEW_VERIFY_LIMIT = int(os.getenv("VIEW_VERIFY_LIMIT", "50"))
+VIEW_VERIFY_CONCURRENCY = int(os.getenv("VIEW_VERIFY_CONCURRENCY", "5"))
+
+# Group commit for roll inserts - off by default
+ROLL_BATCH_WRITES = os.getenv("ROLL_BATCH_WRITES", "false").lower() in ("1", "true", "yes")
+ROLL_BATCH_DELAY_MS = float(os.getenv("ROLL_BATCH_DELAY_MS", "5"))
+ROLL_BATCH_MAX_SIZE = int(os.getenv("ROLL_BATCH_MAX_SIZE", "500"))
+
+# Public roll lists longer than this are summarized as the top rolls plus a count
+ROLL_LIST_MAX_LINES = int(os.getenv("ROLL_LIST_MAX_LINES", "50"))
+
+# Prometheus metrics endpoint - disabled unless METRICS_PORT is set
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+
+# Sharding - SHARD_COUNT="auto" runs every shard in this process with AutoShardedBot,
+# a number fixes the total; SHARD_IDS (e.g. "0-3" or "0,2") picks this process's shards
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = None
+if os.getenv("SHARD_IDS"):
+    SHARD_IDS = []
+    for part in os.getenv("SHARD_IDS").split(","):
+        start, _, end = part.strip().partition("-")
+        SHARD_IDS.extend(range(int(start), int(end or start) + 1))
+    # discord.py needs the total to place a subset of shards
+    if not SHARD_COUNT or SHARD_COUNT == "auto":
+        raise ValueError("SHARD_IDS needs a numeric SHARD_COUNT (the total number of shards)")
+    if max(SHARD_IDS) >= int(SHARD_COUNT):
+        raise ValueError(f"SHARD_IDS must be below SHARD_COUNT ({SHARD_COUNT}), got {max(SHARD_IDS)}")
+
+# Patch in-process caches from Postgres NOTIFY so several bot processes stay coherent
+CACHE_NOTIFY = os.getenv("CACHE_NOTIFY", "true").lower() in ("1", "true", "yes")
+
+# Database pool
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))  # seconds
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "5"))  # seconds
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# Button lifecycle - buttons close this many days after posting (0 = never, the
+# default) and their rolls are moved to the monthly archive in small batches.
+# Expired messages keep their buttons; a click on one is answered "closed"
+BUTTON_EXPIRY_DAYS = float(os.getenv("BUTTON_EXPIRY_DAYS", "0"))
+ARCHIVE_INTERVAL_MINUTES = float(os.getenv("ARCHIVE_INTERVAL_MINUTES", "10"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_MAX_BATCHES = int(os.getenv("ARCHIVE_MAX_BATCHES", "50"))
+
+# Optional read replica for reads that can tolerate a little lag - disabled unless set
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+DB_REPLICA_POOL_MAX_SIZE = int(os.getenv("DB_REPLICA_POOL_MAX_SIZE", "10"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))  # seconds behind before reads go to the primary
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))  # seconds
+# Reads of a button this process just wrote stay on the primary for this long (seconds)
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "10"))
+
+# Interaction deadline - Discord fails an interaction that isn't acknowledged within 3s
+INTERACTION_DEFER_AFTER = float(os.getenv("INTERACTION_DEFER_AFTER", "2.0"))  # seconds before auto-defer
+INTERACTION_DB_TIMEOUT = float(os.getenv("INTERACTION_DB_TIMEOUT", "2.5"))  # per query, seconds
+
+# Clicks arriving before the database is up wait this long (seconds) before being turned away
+STARTUP_CLICK_WAIT = float(os.getenv("STARTUP_CLICK_WAIT", "1.5"))
+
+# Roll clicks run through one worker per button - queue bound, batch size, idle eviction (seconds)
+ACTOR_QUEUE_SIZE = int(os.getenv("ACTOR_QUEUE_SIZE", "200"))
+ACTOR_BATCH_SIZE = int(os.getenv("ACTOR_BATCH_SIZE", "50"))
+ACTOR_IDLE_TIMEOUT = float(os.getenv("ACTOR_IDLE_TIMEOUT", "60"))
+
+# Write-behind roll journal - accepts rolls while the database is unavailable (disabled unless set)
+ROLL_JOURNAL_PATH = os.getenv("ROLL_JOURNAL_PATH")
+ROLL_JOURNAL_FSYNC_MS = float(os.getenv("ROLL_JOURNAL_FSYNC_MS", "5"))
+ROLL_JOURNAL_GROUP_SIZE = int(os.getenv("ROLL_JOURNAL_GROUP_SIZE", "100"))
+ROLL_JOURNAL_REPLAY_BATCH = int(os.getenv("ROLL_JOURNAL_REPLAY_BATCH", "500"))
+
+# Logging - "json" or "text" output; each call site logs at most LOG_RATE_LIMIT_BURST
+# records per LOG_RATE_LIMIT_INTERVAL seconds below ERROR level
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_LIMIT_INTERVAL = float(os.getenv("LOG_RATE_LIMIT_INTERVAL", "10"))
+LOG_RATE_LIMIT_BURST = int(os.getenv("LOG_RATE_LIMIT_BURST", "5"))
+
+# Interactions slower than this (ms) write their span tree to SLOW_TRACE_PATH (0 = off)
+SLOW_INTERACTION_THRESHOLD_MS = float(os.getenv("SLOW_INTERACTION_THRESHOLD_MS", "1000"))
+SLOW_TRACE_PATH = os.getenv("SLOW_TRACE_PATH", "logs/slow_interactions.jsonl")
+SLOW_TRACE_MAX_BYTES = int(os.getenv("SLOW_TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_TRACE_BACKUPS = int(os.getenv("SLOW_TRACE_BACKUPS", "5"))
+
+# Event loop watchdog - heartbeat interval (seconds) and the lag that counts as a stall (ms)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))
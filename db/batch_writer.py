@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from db.connection import get_db_pool
+
+logger = logging.getLogger('discord_bot')
+
+class RollBatchWriter:
+    """Group commit for roll inserts.
+
+    Inserts arriving within max_delay seconds of each other are written by a
+    single statement in one transaction. Each caller gets back its own inserted
+    row, or None when the user had already rolled on that button.
+    """
+    def __init__(self, max_delay, max_batch_size):
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self.pending = []  # ((button_id, user_id, user_display_name, roll), future)
+        self.timer = None
+        self.batches = 0
+        self.rows = 0
+
+    async def insert(self, button_id, user_id, user_display_name, roll):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(((button_id, user_id, user_display_name, roll), future))
+
+        if len(self.pending) >= self.max_batch_size:
+            asyncio.create_task(self._flush(self._take()))
+        elif self.timer is None:
+            self.timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    def _take(self):
+        batch, self.pending = self.pending, []
+        return batch
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self.timer = None
+        batch = self._take()
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        # Only the first request per (button, user) can win; later duplicates
+        # in the same batch would otherwise match the winner's returned row
+        winners = {}
+        for i, ((button_id, user_id, _, _), _) in enumerate(batch):
+            winners.setdefault((str(button_id), user_id), i)
+        values = [batch[i][0] for i in winners.values()]
+
+        try:
+            db_pool = await get_db_pool()
+            async with db_pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    INSERT INTO rolls (button_id, user_id, user_display_name, roll)
+                    SELECT v.* FROM unnest($1::UUID[], $2::BIGINT[], $3::TEXT[], $4::INTEGER[])
+                        AS v(button_id, user_id, user_display_name, roll)
+                    JOIN button_messages m ON m.button_id = v.button_id AND m.status = 'open'
+                    ON CONFLICT (button_id, user_id) DO NOTHING
+                    RETURNING button_id, user_id, user_display_name, roll, timestamp
+                    """,
+                    [v[0] for v in values],
+                    [v[1] for v in values],
+                    [v[2] for v in values],
+                    [v[3] for v in values]
+                )
+        except Exception as e:
+            logger.error(f"Batched roll insert of {len(batch)} rows failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.rows += len(rows)
+        inserted = {(str(r["button_id"]), r["user_id"]): r for r in rows}
+        for i, ((button_id, user_id, _, _), future) in enumerate(batch):
+            key = (str(button_id), user_id)
+            row = inserted.get(key) if winners[key] == i else None
+            if not future.done():
+                future.set_result(row)
+
+    def get_stats(self):
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "pending": len(self.pending)
+        }
+
+# Create a global batch writer instance when group commit is enabled
+from config import ROLL_BATCH_WRITES, ROLL_BATCH_DELAY_MS, ROLL_BATCH_MAX_SIZE
+roll_writer = RollBatchWriter(ROLL_BATCH_DELAY_MS / 1000, ROLL_BATCH_MAX_SIZE) if ROLL_BATCH_WRITES else None
@@ -0,0 +1,114 @@
+import datetime
+import itertools
+import contextlib
+from collections import OrderedDict
+from config import ROLL_CACHE_SIZE
+
+class RollCache:
+    """LRU cache of each button's roll list, kept in sync by db.operations"""
+    def __init__(self, max_buttons):
+        self.max_buttons = max_buttons
+        self.entries = OrderedDict()  # button_id -> list of roll dicts
+        self.versions = {}  # button_id -> state version, changes on every mutation
+        self.version_counter = itertools.count(1)
+        self.loads = {}  # button_id -> [reads in flight, changes notified since the first began]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, button_id):
+        key = str(button_id)
+        rolls = self.entries.get(key)
+        if rolls is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return rolls
+
+    def set(self, button_id, rolls):
+        key = str(button_id)
+        self.entries[key] = [dict(r) for r in rolls]
+        self.entries.move_to_end(key)
+        self.versions[key] = next(self.version_counter)
+        # A change committed after the read's snapshot can be notified before
+        # we get here; replay them all, in order, on top (patching is idempotent)
+        load = self.loads.get(key)
+        if load:
+            for change in load[1]:
+                self.patch(change)
+        while len(self.entries) > self.max_buttons:
+            evicted, _ = self.entries.popitem(last=False)
+            self.versions.pop(evicted, None)
+
+    @contextlib.contextmanager
+    def loading(self, button_id):
+        """Wrap a DB read whose result is passed to set(), so no change notification is lost to it"""
+        key = str(button_id)
+        load = self.loads.setdefault(key, [0, []])
+        load[0] += 1
+        try:
+            yield
+        finally:
+            load[0] -= 1
+            if load[0] == 0 and self.loads.get(key) is load:
+                del self.loads[key]
+
+    def add_roll(self, button_id, roll):
+        key = str(button_id)
+        rolls = self.entries.get(key)
+        # Idempotent: our own inserts also come back as change notifications
+        if rolls is not None and not any(r["user_id"] == roll["user_id"] for r in rolls):
+            rolls.append(dict(roll))
+            self.versions[key] = next(self.version_counter)
+
+    def remove_roll(self, button_id, user_id):
+        key = str(button_id)
+        rolls = self.entries.get(key)
+        if rolls is not None:
+            remaining = [r for r in rolls if r["user_id"] != user_id]
+            if len(remaining) != len(rolls):
+                rolls[:] = remaining
+                self.versions[key] = next(self.version_counter)
+
+    def version(self, button_id):
+        """Current state version of a cached button, None when it isn't cached"""
+        return self.versions.get(str(button_id))
+
+    def has_rolled(self, button_id, user_id):
+        """True/False when the button is cached, None when we have to ask the DB"""
+        rolls = self.entries.get(str(button_id))
+        if rolls is None:
+            return None
+        return any(r["user_id"] == user_id for r in rolls)
+
+    def invalidate(self, button_id):
+        key = str(button_id)
+        self.entries.pop(key, None)
+        self.versions.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.versions.clear()
+        for load in self.loads.values():
+            load[1].clear()
+
+    def apply_change(self, change):
+        """Patch the cache from a roll change published by any bot process"""
+        load = self.loads.get(str(change["button_id"]))
+        if load:
+            load[1].append(change)
+        self.patch(change)
+
+    def patch(self, change):
+        if change["op"] == "insert":
+            self.add_roll(change["button_id"], {
+                "user_id": change["user_id"],
+                "user_display_name": change["user_display_name"],
+                "roll": change["roll"],
+                "timestamp": datetime.datetime.fromisoformat(change["timestamp"]) if change["timestamp"] else None
+            })
+        elif change["op"] == "delete":
+            self.remove_roll(change["button_id"], change["user_id"])
+
+# Create a global roll cache instance
+roll_cache = RollCache(ROLL_CACHE_SIZE)
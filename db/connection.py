@@ -1,15 +1,205 @@
+import json
+import time
 import asyncio
 import asyncpg
 import logging
-from config import DATABASE_URL
+import contextlib
+from config import (
+    DATABASE_URL, CACHE_NOTIFY, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    DB_POOL_MAX_INACTIVE_LIFETIME, DB_COMMAND_TIMEOUT, DB_STATEMENT_CACHE_SIZE,
+    DATABASE_REPLICA_URL, DB_REPLICA_POOL_MAX_SIZE, REPLICA_MAX_LAG, READ_YOUR_WRITES_WINDOW
+)
+from db.queries import PREPARED_QUERIES, REPLICA_QUERIES, REPLICA_LAG
+from utils.metrics import db_pool_acquire_wait, db_pool_failed_acquires
+from utils.tracing import span
 
 logger = logging.getLogger('discord_bot')
 db_pool = None
 
+# Optional read replica; reads fall back to db_pool whenever it can't be trusted
+replica_pool = None
+replica_healthy = False
+replica_lag = None
+recent_writes = {}  # button_id -> monotonic time this process last wrote it
+
+# Dedicated connection for LISTEN; pooled connections can't hold a subscription
+ROLL_CHANGES_CHANNEL = "roll_changes"
+listener_conn = None
+roll_change_subscribers = []
+
+class PreparedConnection(asyncpg.Connection):
+    """Connection carrying the hot-path statements, prepared once when it opens"""
+    # asyncpg.Connection uses __slots__; subclassing without them gives us a __dict__
+    prepared = None
+
+
+class InstrumentedPool:
+    """asyncpg pool wrapper that records acquire wait times and failures"""
+    def __init__(self, pool):
+        self.pool = pool
+        self.acquires = 0
+        self.failed_acquires = 0
+        self.total_acquire_wait = 0.0
+        self.max_acquire_wait = 0.0
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, timeout=None):
+        start = time.perf_counter()
+        try:
+            with span("db.pool_acquire"):
+                conn = await self.pool.acquire(timeout=timeout)
+        except Exception:
+            self.failed_acquires += 1
+            db_pool_failed_acquires.inc()
+            raise
+
+        waited = time.perf_counter() - start
+        self.acquires += 1
+        self.total_acquire_wait += waited
+        self.max_acquire_wait = max(self.max_acquire_wait, waited)
+        db_pool_acquire_wait.observe(waited)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    def in_use(self):
+        return self.pool.get_size() - self.pool.get_idle_size()
+
+    def get_stats(self):
+        """Pool counters; max_acquire_wait resets on every call"""
+        stats = {
+            "size": self.pool.get_size(),
+            "in_use": self.in_use(),
+            "max_size": self.pool.get_max_size(),
+            "acquires": self.acquires,
+            "failed_acquires": self.failed_acquires,
+            "avg_acquire_wait": self.total_acquire_wait / self.acquires if self.acquires else 0.0,
+            "max_acquire_wait": self.max_acquire_wait
+        }
+        self.max_acquire_wait = 0.0
+        return stats
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+
+async def init_connection(conn):
+    conn.prepared = {}
+    for name, query in PREPARED_QUERIES.items():
+        conn.prepared[name] = await conn.prepare(query)
+
+async def init_replica_connection(conn):
+    conn.prepared = {}
+    for name in REPLICA_QUERIES:
+        conn.prepared[name] = await conn.prepare(PREPARED_QUERIES[name])
+
+async def create_db_pool(dsn=DATABASE_URL):
+    """Migrate the schema, then open the pool (statements are prepared against the final schema)"""
+    from db.migrations import run_migrations
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        await run_migrations(conn)
+    finally:
+        await conn.close()
+
+    pool = await asyncpg.create_pool(
+        dsn,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        connection_class=PreparedConnection,
+        init=init_connection
+    )
+    return InstrumentedPool(pool)
+
+async def create_replica_pool(dsn=DATABASE_REPLICA_URL):
+    """Open the read-only pool; the schema comes from the primary, so no migrations"""
+    pool = await asyncpg.create_pool(
+        dsn,
+        min_size=1,
+        max_size=DB_REPLICA_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        connection_class=PreparedConnection,
+        init=init_replica_connection
+    )
+    return InstrumentedPool(pool)
+
 async def get_db_pool():
     global db_pool
     return db_pool
 
+def note_write(button_id):
+    """Pin reads of a button to the primary until the replica has had time to catch up"""
+    now = time.monotonic()
+    recent_writes[str(button_id)] = now
+    if len(recent_writes) > 1000:
+        cutoff = now - READ_YOUR_WRITES_WINDOW
+        for key in [k for k, t in recent_writes.items() if t < cutoff]:
+            del recent_writes[key]
+
+def written_recently(button_id):
+    written = recent_writes.get(str(button_id))
+    return written is not None and time.monotonic() - written < READ_YOUR_WRITES_WINDOW
+
+def mark_replica_unhealthy(reason):
+    global replica_healthy
+    if replica_healthy:
+        logger.warning(f"Read replica unavailable, reading from the primary: {reason}")
+    replica_healthy = False
+
+async def check_replica():
+    """Connect to the replica if needed and measure its lag; reads only use it while it's caught up"""
+    global replica_pool, replica_healthy, replica_lag
+    if not DATABASE_REPLICA_URL:
+        return None
+
+    try:
+        if replica_pool is None:
+            replica_pool = await create_replica_pool()
+            logger.info("Connected to read replica")
+        async with replica_pool.acquire(timeout=2) as conn:
+            replica_lag = await conn.fetchval(REPLICA_LAG, timeout=2)
+    except Exception as e:
+        replica_lag = None
+        mark_replica_unhealthy(e)
+        return None
+
+    # NULL until the replica has replayed its first transaction
+    if replica_lag is None:
+        mark_replica_unhealthy("replica has not replayed any transactions yet")
+        return None
+
+    healthy = replica_lag <= REPLICA_MAX_LAG
+    if healthy and not replica_healthy:
+        logger.info(f"Read replica healthy ({replica_lag:.1f}s behind), serving reads from it")
+    elif not healthy:
+        mark_replica_unhealthy(f"{replica_lag:.1f}s behind the primary")
+    replica_healthy = healthy
+    return replica_lag
+
+async def read_query(run, button_id=None):
+    """Run run(conn) on the replica when it's usable, otherwise on the primary.
+
+    Reads of a button this process wrote within READ_YOUR_WRITES_WINDOW always
+    go to the primary. A replica failure marks it unhealthy and retries on the
+    primary. Returns (result, from_replica).
+    """
+    if replica_healthy and not (button_id is not None and written_recently(button_id)):
+        try:
+            async with replica_pool.acquire(timeout=1) as conn:
+                return await run(conn), True
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            mark_replica_unhealthy(e)
+
+    async with db_pool.acquire() as conn:
+        return await run(conn), False
+
 async def setup_database(bot):
     global db_pool
     try:
@@ -19,16 +209,26 @@ async def setup_database(bot):
         
         for attempt in range(retry_attempts):
             try:
-                db_pool = await asyncpg.create_pool(DATABASE_URL)
+                # Brings the schema up to date before the pool opens
+                db_pool = await create_db_pool()
                 logger.info("Successfully connected to database")
                 
-                # Ensure tables exist
-                await create_tables()
+                # Keep in-process caches coherent with other bot processes
+                if CACHE_NOTIFY:
+                    from db.cache import roll_cache
+                    subscribe_roll_changes(roll_cache.apply_change)
+                    await start_roll_listener()
+                
+                # The replica is optional; reads use the primary until it checks out
+                if DATABASE_REPLICA_URL:
+                    await check_replica()
                 
                 # Attach pool to bot for easy access
                 bot.db_pool = db_pool
                 return True
             except Exception as e:
+                # Don't leak this attempt's pool and listener into the next one
+                await close_database()
                 if attempt < retry_attempts - 1:
                     logger.warning(f"Database connection attempt {attempt+1} failed: {e}. Retrying in {retry_delay} seconds...")
                     await asyncio.sleep(retry_delay)
@@ -40,28 +240,67 @@ async def setup_database(bot):
         logger.critical(f"Failed to initialize database: {e}")
         return False
 
-async def create_tables():
-    """Create necessary tables if they don't exist"""
-    global db_pool
-    async with db_pool.acquire() as conn:
-        # Create button_messages table
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS button_messages (
-                button_id TEXT PRIMARY KEY,
-                channel_id BIGINT NOT NULL,
-                message_id BIGINT NOT NULL
-            )
-        ''')
-        
-        # Create rolls table
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS rolls (
-                id SERIAL PRIMARY KEY,
-                button_id TEXT NOT NULL,
-                user_id BIGINT NOT NULL,
-                user_display_name TEXT NOT NULL,
-                roll INTEGER NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(button_id, user_id)
-            )
-        ''')
\ No newline at end of file
+async def close_database():
+    """Close the primary pool and the listener connection, if open"""
+    global db_pool, listener_conn
+    if listener_conn is not None:
+        # Closing fires termination listeners; this one would reconnect
+        listener_conn.remove_termination_listener(on_listener_terminated)
+        try:
+            await listener_conn.close()
+        except Exception as e:
+            logger.warning(f"Failed to close roll change listener: {e}")
+        listener_conn = None
+    if db_pool is not None:
+        try:
+            await db_pool.close()
+        except Exception as e:
+            logger.warning(f"Failed to close database pool: {e}")
+        db_pool = None
+
+def subscribe_roll_changes(callback):
+    """Call callback(change) for every roll insert/delete from any process"""
+    if callback not in roll_change_subscribers:
+        roll_change_subscribers.append(callback)
+
+def dispatch_roll_change(connection, pid, channel, payload):
+    try:
+        change = json.loads(payload)
+    except ValueError:
+        logger.warning(f"Ignoring malformed roll change notification: {payload[:100]}")
+        return
+    for callback in roll_change_subscribers:
+        try:
+            callback(change)
+        except Exception as e:
+            logger.error(f"Roll change subscriber failed: {e}")
+
+async def start_roll_listener():
+    """Open the listener connection, reconnecting if it drops"""
+    global listener_conn
+    listener_conn = await asyncpg.connect(DATABASE_URL)
+    await listener_conn.add_listener(ROLL_CHANGES_CHANNEL, dispatch_roll_change)
+    listener_conn.add_termination_listener(on_listener_terminated)
+    logger.info(f"Listening for {ROLL_CHANGES_CHANNEL} notifications")
+
+def on_listener_terminated(connection):
+    logger.warning("Roll change listener connection lost - reconnecting")
+    asyncio.get_event_loop().create_task(reconnect_roll_listener())
+
+async def reconnect_roll_listener():
+    # Changes made while we were deaf are gone, so cached state can't be trusted
+    from db.cache import roll_cache
+    roll_cache.clear()
+
+    retry_delay = 1  # seconds
+    while True:
+        try:
+            await start_roll_listener()
+            # Drop anything cached while the connection was being re-established
+            roll_cache.clear()
+            return
+        except Exception as e:
+            logger.warning(f"Roll change listener reconnect failed: {e}. Retrying in {retry_delay} seconds...")
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 60)
+
@@ -0,0 +1,199 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+import datetime
+from db.connection import get_db_pool
+
+logger = logging.getLogger('discord_bot')
+
+class RollJournal:
+    """Write-behind journal that accepts rolls while the database is unavailable.
+
+    Each roll is appended to a local JSON-lines file and acknowledged once the
+    group it was written with has been fsynced. Journaled rolls are replayed
+    into rolls in journal order once the database is back; the insert ignores
+    rows that already exist, so replaying after a crash is harmless. Duplicate
+    clicks are refused against the rolls still in the journal; a duplicate of
+    a roll only the database knows about, or a roll on a button that closed,
+    is dropped at replay instead.
+    """
+    def __init__(self, path, fsync_delay, group_size, replay_batch_size):
+        self.path = path
+        self.fsync_delay = fsync_delay
+        self.group_size = group_size
+        self.replay_batch_size = replay_batch_size
+        self.entries = []  # durable, not yet replayed, in journal order
+        self.keys = set()  # (str(button_id), user_id) of every journaled roll not yet replayed
+        self.buffer = []  # (entry, future) waiting for the next fsync
+        self.timer = None
+        self.draining = False  # the last replay batch reached the database
+        self.file_lock = asyncio.Lock()
+        self.file = None
+        self.journaled = 0
+        self.replayed = 0
+        self.dropped = 0
+
+    def load(self):
+        """Read back rolls left over from a previous run"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write was never acknowledged
+                        logger.warning(f"Skipping unreadable roll journal line: {line[:100]!r}")
+                        continue
+                    self.entries.append(entry)
+                    self.keys.add((entry["button_id"], entry["user_id"]))
+        self.file = open(self.path, "a", encoding="utf-8")
+        if self.entries:
+            logger.warning(f"Roll journal holds {len(self.entries)} rolls to replay")
+
+    def backlog(self):
+        return len(self.entries) + len(self.buffer)
+
+    async def append(self, button_id, user_id, user_display_name, roll):
+        """Journal a roll; returns the roll row, or None if the user already has one journaled"""
+        key = (str(button_id), user_id)
+        if key in self.keys:
+            return None
+        self.keys.add(key)
+
+        row = {
+            "user_id": user_id,
+            "user_display_name": user_display_name,
+            "roll": roll,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc)
+        }
+        entry = dict(row, button_id=key[0], timestamp=row["timestamp"].isoformat())
+        future = asyncio.get_running_loop().create_future()
+        self.buffer.append((entry, future))
+
+        if len(self.buffer) >= self.group_size:
+            asyncio.create_task(self._sync(self._take()))
+        elif self.timer is None:
+            self.timer = asyncio.create_task(self._sync_later())
+        await future
+        return row
+
+    def _take(self):
+        group, self.buffer = self.buffer, []
+        return group
+
+    async def _sync_later(self):
+        await asyncio.sleep(self.fsync_delay)
+        self.timer = None
+        group = self._take()
+        if group:
+            await self._sync(group)
+
+    def _write(self, lines):
+        self.file.write("".join(lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    async def _sync(self, group):
+        lines = [json.dumps(entry) + "\n" for entry, _ in group]
+        try:
+            async with self.file_lock:
+                # File I/O runs in a thread so an fsync never stalls the event loop
+                await asyncio.to_thread(self._write, lines)
+        except Exception as e:
+            logger.error(f"Roll journal write of {len(group)} rolls failed: {e}")
+            for entry, future in group:
+                self.keys.discard((entry["button_id"], entry["user_id"]))
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.journaled += len(group)
+        for entry, future in group:
+            self.entries.append(entry)
+            if not future.done():
+                future.set_result(True)
+
+    async def replay(self):
+        """Insert journaled rolls in order, then shrink the file to what's left"""
+        # Import here to avoid circular imports
+        from db.cache import roll_cache
+
+        while self.entries:
+            batch = self.entries[:self.replay_batch_size]
+            try:
+                rows = await self._insert(batch)
+            except Exception:
+                self.draining = False
+                raise
+            self.draining = True
+
+            inserted = {(str(r["button_id"]), r["user_id"]) for r in rows}
+            for e in batch:
+                key = (e["button_id"], e["user_id"])
+                self.keys.discard(key)
+                if key not in inserted:
+                    # Already rolled per the database, or the button closed meanwhile;
+                    # the cache may still show the journaled roll
+                    self.dropped += 1
+                    roll_cache.invalidate(e["button_id"])
+            del self.entries[:len(batch)]
+            self.replayed += len(batch)
+            await self._compact()
+            logger.info(f"Replayed {len(batch)} journaled rolls, {len(self.entries)} left")
+        self.draining = False
+
+    async def _insert(self, batch):
+        db_pool = await get_db_pool()
+        async with db_pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                INSERT INTO rolls (button_id, user_id, user_display_name, roll, timestamp)
+                SELECT v.button_id, v.user_id, v.user_display_name, v.roll, v.timestamp
+                FROM unnest($1::UUID[], $2::BIGINT[], $3::TEXT[], $4::INTEGER[], $5::TIMESTAMPTZ[])
+                    WITH ORDINALITY AS v(button_id, user_id, user_display_name, roll, timestamp, ord)
+                JOIN button_messages m ON m.button_id = v.button_id AND m.status = 'open'
+                ORDER BY v.ord
+                ON CONFLICT (button_id, user_id) DO NOTHING
+                RETURNING button_id, user_id
+                """,
+                [uuid.UUID(e["button_id"]) for e in batch],
+                [e["user_id"] for e in batch],
+                [e["user_display_name"] for e in batch],
+                [e["roll"] for e in batch],
+                [datetime.datetime.fromisoformat(e["timestamp"]) for e in batch]
+            )
+
+    def _rewrite(self, lines):
+        self.file.close()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    async def _compact(self):
+        async with self.file_lock:
+            lines = [json.dumps(entry) + "\n" for entry in self.entries]
+            await asyncio.to_thread(self._rewrite, lines)
+
+    def get_stats(self):
+        return {
+            "backlog": self.backlog(),
+            "journaled": self.journaled,
+            "replayed": self.replayed,
+            "dropped": self.dropped
+        }
+
+# Create a global journal instance when write-behind is enabled
+from config import ROLL_JOURNAL_PATH, ROLL_JOURNAL_FSYNC_MS, ROLL_JOURNAL_GROUP_SIZE, ROLL_JOURNAL_REPLAY_BATCH
+roll_journal = None
+if ROLL_JOURNAL_PATH:
+    roll_journal = RollJournal(
+        ROLL_JOURNAL_PATH, ROLL_JOURNAL_FSYNC_MS / 1000, ROLL_JOURNAL_GROUP_SIZE, ROLL_JOURNAL_REPLAY_BATCH
+    )
+    roll_journal.load()
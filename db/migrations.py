@@ -0,0 +1,357 @@
+import logging
+
+logger = logging.getLogger('discord_bot')
+
+# Rows rewritten per transaction when backfilling large tables
+BACKFILL_BATCH_SIZE = 5000
+
+# Arbitrary key for pg_advisory_lock so only one process migrates at a time
+MIGRATION_LOCK_KEY = 7262001
+
+async def create_initial_schema(conn):
+    """Tables as they existed before versioned migrations"""
+    # Create button_messages table
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS button_messages (
+            button_id TEXT PRIMARY KEY,
+            channel_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL
+        )
+    ''')
+    
+    # Legacy buttons are routed by message ID
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS button_messages_message_id_idx ON button_messages (message_id)
+    ''')
+    
+    # Create rolls table
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS rolls (
+            id SERIAL PRIMARY KEY,
+            button_id TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            user_display_name TEXT NOT NULL,
+            roll INTEGER NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(button_id, user_id)
+        )
+    ''')
+    
+    # Per-button aggregates, maintained by a trigger on rolls
+    stats_exists = await conn.fetchval("SELECT to_regclass('button_stats') IS NOT NULL")
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS button_stats (
+            button_id TEXT PRIMARY KEY,
+            roll_count INTEGER NOT NULL DEFAULT 0,
+            roll_sum BIGINT NOT NULL DEFAULT 0,
+            min_roll INTEGER,
+            max_roll INTEGER,
+            last_roll_at TIMESTAMP
+        )
+    ''')
+    await conn.execute('''
+        CREATE OR REPLACE FUNCTION update_button_stats() RETURNS TRIGGER AS $$
+        DECLARE
+            stats button_stats%ROWTYPE;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO button_stats (button_id, roll_count, roll_sum, min_roll, max_roll, last_roll_at)
+                VALUES (NEW.button_id, 1, NEW.roll, NEW.roll, NEW.roll, NEW.timestamp)
+                ON CONFLICT (button_id) DO UPDATE SET
+                    roll_count = button_stats.roll_count + 1,
+                    roll_sum = button_stats.roll_sum + EXCLUDED.roll_sum,
+                    min_roll = LEAST(button_stats.min_roll, EXCLUDED.min_roll),
+                    max_roll = GREATEST(button_stats.max_roll, EXCLUDED.max_roll),
+                    last_roll_at = GREATEST(button_stats.last_roll_at, EXCLUDED.last_roll_at);
+                RETURN NEW;
+            END IF;
+
+            UPDATE button_stats
+            SET roll_count = roll_count - 1, roll_sum = roll_sum - OLD.roll
+            WHERE button_id = OLD.button_id
+            RETURNING * INTO stats;
+
+            -- Extremes can't be un-applied; rescan only when the deleted row was one
+            IF FOUND AND (OLD.roll = stats.min_roll OR OLD.roll = stats.max_roll
+                          OR OLD.timestamp = stats.last_roll_at) THEN
+                UPDATE button_stats
+                SET min_roll = agg.min_roll, max_roll = agg.max_roll, last_roll_at = agg.last_roll_at
+                FROM (
+                    SELECT MIN(roll) AS min_roll, MAX(roll) AS max_roll, MAX(timestamp) AS last_roll_at
+                    FROM rolls WHERE button_id = OLD.button_id
+                ) agg
+                WHERE button_stats.button_id = OLD.button_id;
+            END IF;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    await conn.execute('''
+        DROP TRIGGER IF EXISTS rolls_button_stats ON rolls;
+        CREATE TRIGGER rolls_button_stats
+            AFTER INSERT OR DELETE ON rolls
+            FOR EACH ROW EXECUTE FUNCTION update_button_stats()
+    ''')
+    
+    # First run: seed the aggregates from the existing rolls
+    if not stats_exists:
+        await conn.execute('''
+            INSERT INTO button_stats (button_id, roll_count, roll_sum, min_roll, max_roll, last_roll_at)
+            SELECT button_id, COUNT(*), SUM(roll), MIN(roll), MAX(roll), MAX(timestamp)
+            FROM rolls GROUP BY button_id
+            ON CONFLICT (button_id) DO NOTHING
+        ''')
+
+async def create_index_concurrently(conn, name, table, columns, unique=False):
+    """CREATE INDEX CONCURRENTLY, replacing a leftover invalid index from an interrupted run"""
+    valid = await conn.fetchval(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = $1",
+        name
+    )
+    if valid:
+        return
+    if valid is False:
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    await conn.execute(f"CREATE {kind} CONCURRENTLY {name} ON {table} ({columns})")
+
+async def backfill_native_types(conn):
+    """Fill the shadow columns of existing rolls, one primary key range per transaction.
+
+    Ranges walk the primary key index, so each batch costs the same however
+    much is already done. The last id reached is recorded in
+    migration_progress, so a restarted process picks up where this one
+    stopped. Rows inserted from here on are filled by the sync trigger.
+    """
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS migration_progress (
+            name TEXT PRIMARY KEY,
+            last_id BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    last_id = await conn.fetchval(
+        "SELECT last_id FROM migration_progress WHERE name = 'rolls_native_types'"
+    ) or 0
+    max_id = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM rolls")
+    if last_id:
+        logger.info(f"Resuming rolls backfill at id {last_id} of {max_id}")
+
+    backfilled = 0
+    batches = 0
+    while last_id < max_id:
+        upper = last_id + BACKFILL_BATCH_SIZE
+        async with conn.transaction():
+            status = await conn.execute('''
+                UPDATE rolls SET button_uuid = button_id::uuid, timestamp_tz = timestamp
+                WHERE id > $1::BIGINT AND id <= $2::BIGINT AND button_uuid IS NULL
+            ''', last_id, upper)
+            await conn.execute('''
+                INSERT INTO migration_progress (name, last_id) VALUES ('rolls_native_types', $1)
+                ON CONFLICT (name) DO UPDATE SET last_id = EXCLUDED.last_id, updated_at = CURRENT_TIMESTAMP
+            ''', upper)
+        backfilled += int(status.split()[-1])
+        last_id = upper
+        batches += 1
+        if batches % 100 == 0:
+            logger.info(f"Backfilled rolls up to id {min(last_id, max_id)} of {max_id}")
+    logger.info(f"Backfilled {backfilled} rolls with native types")
+
+async def convert_to_native_types(conn):
+    """UUID button IDs, timestamptz roll times, (button_id, timestamp) index and FK.
+
+    rolls can be large, so instead of an in-place ALTER TYPE (which rewrites
+    the table under an exclusive lock) the new values are written to shadow
+    columns in small batches while a trigger keeps new rows in sync, and the
+    columns are swapped in one short transaction at the end.
+    """
+    button_id_type = await conn.fetchval(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = 'rolls' AND column_name = 'button_id'"
+    )
+
+    if button_id_type != "uuid":
+        await conn.execute('''
+            ALTER TABLE rolls ADD COLUMN IF NOT EXISTS button_uuid UUID,
+                              ADD COLUMN IF NOT EXISTS timestamp_tz TIMESTAMPTZ
+        ''')
+        await conn.execute('''
+            CREATE OR REPLACE FUNCTION rolls_sync_native_types() RETURNS TRIGGER AS $$
+            BEGIN
+                NEW.button_uuid := NEW.button_id::uuid;
+                NEW.timestamp_tz := NEW.timestamp;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+            DROP TRIGGER IF EXISTS rolls_sync_native_types ON rolls;
+            CREATE TRIGGER rolls_sync_native_types
+                BEFORE INSERT OR UPDATE ON rolls
+                FOR EACH ROW EXECUTE FUNCTION rolls_sync_native_types()
+        ''')
+
+        await backfill_native_types(conn)
+
+        # Indexes and the NOT NULL proof are built without blocking writes
+        await create_index_concurrently(
+            conn, "rolls_button_uuid_user_id_key", "rolls", "button_uuid, user_id", unique=True
+        )
+        await create_index_concurrently(
+            conn, "rolls_button_id_timestamp_idx", "rolls", "button_uuid, timestamp_tz"
+        )
+        await conn.execute('''
+            ALTER TABLE rolls DROP CONSTRAINT IF EXISTS rolls_button_uuid_not_null;
+            ALTER TABLE rolls ADD CONSTRAINT rolls_button_uuid_not_null CHECK (button_uuid IS NOT NULL) NOT VALID
+        ''')
+        await conn.execute("ALTER TABLE rolls VALIDATE CONSTRAINT rolls_button_uuid_not_null")
+
+        # Swap: everything here is catalog-only or touches the small tables
+        async with conn.transaction():
+            await conn.execute('''
+                LOCK TABLE rolls IN ACCESS EXCLUSIVE MODE;
+                DROP TRIGGER rolls_sync_native_types ON rolls;
+                DROP FUNCTION rolls_sync_native_types();
+                ALTER TABLE rolls DROP COLUMN button_id, DROP COLUMN timestamp;
+                ALTER TABLE rolls RENAME COLUMN button_uuid TO button_id;
+                ALTER TABLE rolls RENAME COLUMN timestamp_tz TO timestamp;
+                ALTER TABLE rolls ALTER COLUMN timestamp SET DEFAULT CURRENT_TIMESTAMP;
+                ALTER TABLE rolls ALTER COLUMN button_id SET NOT NULL;
+                ALTER TABLE rolls DROP CONSTRAINT rolls_button_uuid_not_null;
+                ALTER TABLE rolls ADD CONSTRAINT rolls_button_id_user_id_key
+                    UNIQUE USING INDEX rolls_button_uuid_user_id_key;
+                ALTER TABLE button_messages ALTER COLUMN button_id TYPE UUID USING button_id::uuid;
+                ALTER TABLE button_stats ALTER COLUMN button_id TYPE UUID USING button_id::uuid,
+                                         ALTER COLUMN last_roll_at TYPE TIMESTAMPTZ;
+                DROP TABLE migration_progress
+            ''')
+
+    # NOT VALID skips the scan under lock; VALIDATE only needs a weak lock
+    await conn.execute('''
+        ALTER TABLE rolls DROP CONSTRAINT IF EXISTS rolls_button_id_fkey;
+        ALTER TABLE rolls ADD CONSTRAINT rolls_button_id_fkey
+            FOREIGN KEY (button_id) REFERENCES button_messages (button_id) ON DELETE CASCADE NOT VALID
+    ''')
+    try:
+        await conn.execute("ALTER TABLE rolls VALIDATE CONSTRAINT rolls_button_id_fkey")
+    except Exception as e:
+        # Rolls for buttons whose message was never saved; new rows are still checked
+        logger.warning(f"Could not validate rolls_button_id_fkey, existing orphan rolls remain: {e}")
+
+async def create_bot_instances(conn):
+    """Registry of running bot processes, used to split the shared rate limit"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_instances (
+            instance_id TEXT PRIMARY KEY,
+            shard_weight INTEGER NOT NULL,
+            last_seen TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+async def create_roll_change_notifications(conn):
+    """NOTIFY every roll insert and delete so other processes can patch their caches"""
+    await conn.execute('''
+        CREATE OR REPLACE FUNCTION notify_roll_change() RETURNS TRIGGER AS $$
+        DECLARE
+            changed rolls%ROWTYPE;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                changed := NEW;
+            ELSE
+                changed := OLD;
+            END IF;
+            PERFORM pg_notify('roll_changes', json_build_object(
+                'op', lower(TG_OP),
+                'button_id', changed.button_id,
+                'user_id', changed.user_id,
+                'user_display_name', changed.user_display_name,
+                'roll', changed.roll,
+                'timestamp', changed.timestamp
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS rolls_notify_change ON rolls;
+        CREATE TRIGGER rolls_notify_change
+            AFTER INSERT OR DELETE ON rolls
+            FOR EACH ROW EXECUTE FUNCTION notify_roll_change()
+    ''')
+
+async def create_button_lifecycle(conn):
+    """Open/closed buttons and a month-partitioned archive for the rolls of closed ones"""
+    await conn.execute('''
+        ALTER TABLE button_messages
+            ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'open',
+            ADD COLUMN IF NOT EXISTS closed_at TIMESTAMPTZ;
+        ALTER TABLE button_messages DROP CONSTRAINT IF EXISTS button_messages_status_check;
+        ALTER TABLE button_messages ADD CONSTRAINT button_messages_status_check
+            CHECK (status IN ('open', 'closed'));
+        CREATE INDEX IF NOT EXISTS button_messages_open_idx
+            ON button_messages (message_id) WHERE status = 'open'
+    ''')
+
+    # Monthly partitions are added by the archiver as it meets new months;
+    # the default partition only catches rows without a timestamp
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS rolls_archive (
+            id INTEGER NOT NULL,
+            button_id UUID NOT NULL,
+            user_id BIGINT NOT NULL,
+            user_display_name TEXT NOT NULL,
+            roll INTEGER NOT NULL,
+            timestamp TIMESTAMPTZ,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (timestamp);
+        CREATE TABLE IF NOT EXISTS rolls_archive_default PARTITION OF rolls_archive DEFAULT;
+        CREATE INDEX IF NOT EXISTS rolls_archive_button_id_idx ON rolls_archive (button_id)
+    ''')
+
+    # Moving rolls to the archive must keep the final stats and not
+    # broadcast a delete per row; the archiver sets rngesus.archiving
+    await conn.execute('''
+        DROP TRIGGER IF EXISTS rolls_button_stats ON rolls;
+        CREATE TRIGGER rolls_button_stats
+            AFTER INSERT OR DELETE ON rolls
+            FOR EACH ROW
+            WHEN (current_setting('rngesus.archiving', true) IS DISTINCT FROM 'on')
+            EXECUTE FUNCTION update_button_stats();
+        DROP TRIGGER IF EXISTS rolls_notify_change ON rolls;
+        CREATE TRIGGER rolls_notify_change
+            AFTER INSERT OR DELETE ON rolls
+            FOR EACH ROW
+            WHEN (current_setting('rngesus.archiving', true) IS DISTINCT FROM 'on')
+            EXECUTE FUNCTION notify_roll_change()
+    ''')
+
+# (version, description, migration) - append only, never renumber
+MIGRATIONS = [
+    (1, "initial schema", create_initial_schema),
+    (2, "native uuid keys, timestamptz and indexes", convert_to_native_types),
+    (3, "bot instance registry", create_bot_instances),
+    (4, "roll change notifications", create_roll_change_notifications),
+    (5, "button lifecycle and rolls archive", create_button_lifecycle),
+]
+
+async def run_migrations(conn):
+    """Apply every migration newer than the recorded schema version"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Several processes may boot at once; the first one migrates
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_KEY)
+    try:
+        current = await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        for version, description, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Applying migration {version}: {description}")
+            await migration(conn)
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES ($1, $2)",
+                version, description
+            )
+        logger.info(f"Database schema at version {MIGRATIONS[-1][0]}")
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_KEY)
@@ -1,93 +1,427 @@
-import pytz
+import asyncio
+import asyncpg
 import logging
-from db.connection import get_db_pool
+import datetime
+from db.connection import get_db_pool, read_query, note_write
+from db.cache import roll_cache
+from db.batch_writer import roll_writer
+from db.journal import roll_journal
+from utils.metrics import timed_query
 
 logger = logging.getLogger('discord_bot')
 
+# Failures meaning the database can't be reached right now, as opposed to a bad query
+DB_UNAVAILABLE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.OperatorInterventionError,
+    asyncpg.exceptions.TooManyConnectionsError,
+)
+
+@timed_query
 async def save_button_message(button_id, channel_id, message_id):
     db_pool = await get_db_pool()
     async with db_pool.acquire() as conn:
         await conn.execute(
             "INSERT INTO button_messages (button_id, channel_id, message_id) VALUES ($1, $2, $3)",
-            str(button_id), channel_id, message_id
+            button_id, channel_id, message_id
         )
 
-async def get_button_messages():
+@timed_query
+async def get_recent_button_messages(limit):
     db_pool = await get_db_pool()
     async with db_pool.acquire() as conn:
-        return await conn.fetch("SELECT button_id, channel_id, message_id FROM button_messages")
+        # Message IDs are snowflakes, so ordering by them is ordering by age
+        return await conn.fetch(
+            "SELECT button_id, channel_id, message_id FROM button_messages ORDER BY message_id DESC LIMIT $1",
+            limit
+        )
 
-async def get_message_info(button_id):
+@timed_query
+async def get_button_id_by_message(message_id):
     db_pool = await get_db_pool()
     async with db_pool.acquire() as conn:
-        return await conn.fetchrow(
-            "SELECT channel_id, message_id FROM button_messages WHERE button_id = $1",
-            str(button_id)
-        )
+        return await conn.prepared["get_button_id_by_message"].fetchval(message_id)
 
-async def save_roll(button_id, user_id, user_display_name, roll):
+@timed_query
+async def is_button_open(button_id):
     db_pool = await get_db_pool()
     async with db_pool.acquire() as conn:
-        await conn.execute(
-            "INSERT INTO rolls (button_id, user_id, user_display_name, roll) VALUES ($1, $2, $3, $4)",
-            str(button_id), user_id, user_display_name, roll
-        )
+        return bool(await conn.prepared["is_button_open"].fetchval(button_id))
 
-async def has_user_rolled(button_id, user_id):
+@timed_query
+async def close_button(button_id):
+    """Close one button; returns (channel_id, message_id) or None if it wasn't open"""
     db_pool = await get_db_pool()
     async with db_pool.acquire() as conn:
-        return await conn.fetchval(
-            "SELECT 1 FROM rolls WHERE button_id = $1 AND user_id = $2",
-            str(button_id), user_id
+        row = await conn.fetchrow(
+            """
+            UPDATE button_messages SET status = 'closed', closed_at = CURRENT_TIMESTAMP
+            WHERE button_id = $1 AND status = 'open'
+            RETURNING channel_id, message_id
+            """,
+            button_id
         )
+    note_write(button_id)
+    roll_cache.invalidate(button_id)
+    return row
 
-async def get_rolls(button_id):
+@timed_query
+async def close_expired_buttons(cutoff_message_id, limit):
+    """Close up to limit open buttons posted before the cutoff snowflake"""
     db_pool = await get_db_pool()
     async with db_pool.acquire() as conn:
-        return await conn.fetch(
-            "SELECT user_id, user_display_name, roll, timestamp FROM rolls WHERE button_id = $1",
-            str(button_id)
+        rows = await conn.fetch(
+            """
+            UPDATE button_messages SET status = 'closed', closed_at = CURRENT_TIMESTAMP
+            WHERE button_id IN (
+                SELECT button_id FROM button_messages
+                WHERE status = 'open' AND message_id < $1
+                ORDER BY message_id
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING button_id, channel_id, message_id
+            """,
+            cutoff_message_id, limit
         )
+    for row in rows:
+        note_write(row["button_id"])
+        roll_cache.invalidate(row["button_id"])
+    return rows
 
-async def get_roll_stats(button_id):
+@timed_query
+async def archive_closed_rolls(limit):
+    """Move up to limit rolls of closed buttons into rolls_archive; returns how many moved"""
     db_pool = await get_db_pool()
     async with db_pool.acquire() as conn:
-        total_rolls = await conn.fetchval(
-            "SELECT COUNT(*) FROM rolls WHERE button_id = $1",
-            str(button_id)
-        )
-        
-        # Get average roll and round to whole number
-        if total_rolls > 0:
-            avg_roll = await conn.fetchval(
-                "SELECT AVG(roll) FROM rolls WHERE button_id = $1",
-                str(button_id)
+        async with conn.transaction():
+            # Keeps button_stats and skips per-row change notifications
+            await conn.execute("SET LOCAL rngesus.archiving = 'on'")
+            batch = await conn.fetch(
+                """
+                SELECT r.id, date_trunc('month', r.timestamp AT TIME ZONE 'UTC') AS month
+                FROM rolls r JOIN button_messages m ON m.button_id = r.button_id
+                WHERE m.status = 'closed'
+                ORDER BY r.id
+                LIMIT $1
+                FOR UPDATE OF r SKIP LOCKED
+                """,
+                limit
             )
-            average_roll = round(avg_roll)  # Round to nearest integer
-        else:
-            average_roll = 0
-            
-        latest_timestamp = await conn.fetchval(
-            "SELECT timestamp FROM rolls WHERE button_id = $1 ORDER BY timestamp DESC LIMIT 1",
-            str(button_id)
+            if not batch:
+                return 0
+
+            # Partitions are per UTC month, created the first time one is needed
+            for month in {r["month"] for r in batch if r["month"] is not None}:
+                next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+                await conn.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS rolls_archive_{month:%Y_%m} PARTITION OF rolls_archive
+                    FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') TO ('{next_month:%Y-%m-%d} 00:00:00+00')
+                    """
+                )
+
+            await conn.execute(
+                """
+                WITH moved AS (
+                    DELETE FROM rolls WHERE id = ANY($1::INTEGER[])
+                    RETURNING id, button_id, user_id, user_display_name, roll, timestamp
+                )
+                INSERT INTO rolls_archive (id, button_id, user_id, user_display_name, roll, timestamp)
+                SELECT id, button_id, user_id, user_display_name, roll, timestamp FROM moved
+                """,
+                [r["id"] for r in batch]
+            )
+    return len(batch)
+
+@timed_query
+async def insert_roll(button_id, user_id, user_display_name, roll):
+    """Insert a roll, returning the new row or None if the user already rolled"""
+    note_write(button_id)
+    if roll_writer:
+        return await roll_writer.insert(button_id, user_id, user_display_name, roll)
+
+    db_pool = await get_db_pool()
+    async with db_pool.acquire() as conn:
+        return await conn.prepared["insert_roll"].fetchrow(button_id, user_id, user_display_name, roll)
+
+@timed_query
+async def insert_roll_and_get_rolls(button_id, user_id, user_display_name, roll):
+    """Insert a roll and read back the button's full roll list in one statement.
+
+    Returns (inserted_row or None, rolls).
+    """
+    note_write(button_id)
+    db_pool = await get_db_pool()
+    async with db_pool.acquire() as conn:
+        rows = await conn.prepared["insert_roll_and_get_rolls"].fetch(
+            button_id, user_id, user_display_name, roll
         )
-        if latest_timestamp:
-            est = pytz.timezone("US/Eastern")
-            latest_roll_time = latest_timestamp.astimezone(est).strftime("%I:%M%p %m/%d/%y")
-        else:
-            latest_roll_time = "No rolls yet"
 
-        return {
-            "total_rolls": total_rolls,
-            "average_roll": average_roll,
-            "latest_roll_time": latest_roll_time
+    inserted = None
+    rolls = []
+    for r in rows:
+        row = {
+            "user_id": r["user_id"],
+            "user_display_name": r["user_display_name"],
+            "roll": r["roll"],
+            "timestamp": r["timestamp"]
         }
+        if r["is_new"]:
+            inserted = row
+        rolls.append(row)
+    return inserted, rolls
 
-async def delete_roll(button_id, user_id):
+@timed_query
+async def get_roll_status(button_id, user_id):
+    """(is_open, has_rolled) for a user on a button, as the database sees it"""
     db_pool = await get_db_pool()
     async with db_pool.acquire() as conn:
-        await conn.execute(
-            "DELETE FROM rolls WHERE button_id = $1 AND user_id = $2",
-            str(button_id), user_id
+        row = await conn.fetchrow(
+            """
+            SELECT status = 'open' AS is_open,
+                   EXISTS (SELECT 1 FROM rolls WHERE button_id = $1 AND user_id = $2) AS has_rolled
+            FROM button_messages WHERE button_id = $1
+            """,
+            button_id, user_id
+        )
+    return (row["is_open"], row["has_rolled"]) if row else (False, False)
+
+async def journal_roll(button_id, user_id, user_display_name, roll, check=False):
+    """record_roll against the write-behind journal; rolls is None if the button isn't cached.
+
+    With check set the database is asked first whether the user may roll.
+    Otherwise only the cache and the journal can refuse a duplicate, and the
+    returned row has pending set: replay may still drop it as a duplicate or
+    because the button closed.
+    """
+    if roll_cache.has_rolled(button_id, user_id):
+        return None, roll_cache.get(button_id)
+
+    pending = True
+    if check:
+        try:
+            is_open, has_rolled = await get_roll_status(button_id, user_id)
+            if not is_open or has_rolled:
+                return None, roll_cache.get(button_id)
+            pending = False
+        except DB_UNAVAILABLE_ERRORS as e:
+            logger.warning(f"Couldn't check a roll before journaling it: {e!r}")
+
+    inserted = await roll_journal.append(button_id, user_id, user_display_name, roll)
+    if not inserted:
+        return None, roll_cache.get(button_id)
+    roll_cache.add_roll(button_id, inserted)
+    return dict(inserted, pending=pending), roll_cache.get(button_id)
+
+async def record_roll(button_id, user_id, user_display_name, roll):
+    """Roll once per user per button, returning (inserted_row or None, rolls).
+
+    Cached buttons answer duplicates without touching the DB and only pay for
+    the INSERT; uncached buttons load their roll list in the same round trip.
+    With the journal enabled, rolls the database can't take are journaled.
+    """
+    if not roll_journal:
+        return await record_roll_in_db(button_id, user_id, user_display_name, roll)
+
+    # While a backlog drains new rolls queue behind it, so they land in click
+    # order; once replay reaches the database they can be checked against it
+    if roll_journal.backlog():
+        return await journal_roll(button_id, user_id, user_display_name, roll, check=roll_journal.draining)
+    try:
+        return await record_roll_in_db(button_id, user_id, user_display_name, roll)
+    except asyncio.TimeoutError:
+        # The INSERT may have committed anyway; journaling the click with a new
+        # roll would change its value at replay, so the user is asked to retry
+        raise
+    except DB_UNAVAILABLE_ERRORS as e:
+        logger.warning(f"Database unavailable, journaling roll: {e!r}")
+        return await journal_roll(button_id, user_id, user_display_name, roll)
+
+async def record_roll_in_db(button_id, user_id, user_display_name, roll):
+    already_rolled = roll_cache.has_rolled(button_id, user_id)
+    if already_rolled:
+        return None, roll_cache.get(button_id)
+
+    if already_rolled is None:
+        with roll_cache.loading(button_id):
+            inserted, rolls = await insert_roll_and_get_rolls(button_id, user_id, user_display_name, roll)
+            roll_cache.set(button_id, rolls)
+        return inserted, roll_cache.get(button_id)
+
+    inserted = await insert_roll(button_id, user_id, user_display_name, roll)
+    if not inserted:
+        # Another writer got this user's roll in first; our cached list is stale
+        roll_cache.invalidate(button_id)
+        return None, await get_rolls(button_id)
+    roll_cache.add_roll(button_id, inserted)
+    return dict(inserted), await get_rolls(button_id)
+
+async def record_rolls(button_id, clicks):
+    """record_roll for a batch of (user_id, user_display_name, roll) clicks on one button.
+
+    Returns the inserted row or None for each click, in click order. Callers
+    must not run two batches for the same button at once.
+    """
+    results = []
+    pending = list(clicks)
+
+    # Until the button's rolls are cached, a click also loads the list
+    while pending and roll_cache.has_rolled(button_id, pending[0][0]) is None:
+        inserted, _ = await record_roll(button_id, *pending.pop(0))
+        results.append(inserted)
+
+    if roll_writer and pending:
+        # With the list cached the inserts only append, so they can share one
+        # group commit; the writer keeps submission order within a flush
+        recorded = await asyncio.gather(*(record_roll(button_id, *click) for click in pending))
+        results.extend(inserted for inserted, _ in recorded)
+    else:
+        for click in pending:
+            inserted, _ = await record_roll(button_id, *click)
+            results.append(inserted)
+    return results
+
+@timed_query
+async def get_rolls(button_id):
+    cached = roll_cache.get(button_id)
+    if cached is not None:
+        return cached
+
+    with roll_cache.loading(button_id):
+        rows, from_replica = await read_query(lambda conn: conn.prepared["get_rolls"].fetch(button_id), button_id)
+        if from_replica:
+            # A lagging snapshot must not be cached: change notifications it missed won't be replayed
+            return [dict(r) for r in rows]
+        roll_cache.set(button_id, rows)
+    return roll_cache.get(button_id)
+
+@timed_query
+async def get_rolls_page(button_id, limit, after=None, before=None, search=None):
+    """One keyset page of rolls ordered by (timestamp, id).
+
+    after/before are (timestamp, id) of the row the page starts after or ends
+    before. Returns (rows, has_more) where has_more says whether another page
+    exists beyond this one in the direction of travel.
+    """
+    conditions = ["button_id = $1"]
+    args = [button_id]
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        args.append(f"%{escaped}%")
+        conditions.append(f"user_display_name ILIKE ${len(args)}")
+    if after:
+        args.extend(after)
+        conditions.append(f"(timestamp, id) > (${len(args) - 1}, ${len(args)})")
+    elif before:
+        args.extend(before)
+        conditions.append(f"(timestamp, id) < (${len(args) - 1}, ${len(args)})")
+    order = "DESC" if before else "ASC"
+    args.append(limit + 1)
+
+    rows, _ = await read_query(
+        lambda conn: conn.fetch(
+            f"""
+            SELECT id, user_id, user_display_name, roll, timestamp FROM rolls
+            WHERE {" AND ".join(conditions)}
+            ORDER BY timestamp {order}, id {order}
+            LIMIT ${len(args)}
+            """,
+            *args
+        ),
+        button_id
+    )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        rows.reverse()
+    return rows, has_more
+
+@timed_query
+async def get_recent_rolls(button_id, limit):
+    """The newest rolls on a button, oldest first"""
+    rows, _ = await read_query(
+        lambda conn: conn.prepared["get_recent_rolls"].fetch(button_id, limit), button_id
+    )
+    return list(reversed(rows))
+
+@timed_query
+async def get_roll_stats(button_id):
+    """Stats and message coordinates for a button from one indexed lookup"""
+    row, _ = await read_query(lambda conn: conn.prepared["get_roll_stats"].fetchrow(button_id), button_id)
+
+    total_rolls = row["roll_count"] or 0
+    # Round average to whole number
+    average_roll = round(row["roll_sum"] / total_rolls) if total_rolls > 0 else 0
+
+    return {
+        "total_rolls": total_rolls,
+        "average_roll": average_roll,
+        "highest_roll": row["max_roll"],
+        "lowest_roll": row["min_roll"],
+        "latest_roll_at": row["last_roll_at"],
+        "channel_id": row["channel_id"],
+        "message_id": row["message_id"]
+    }
+
+@timed_query
+async def delete_roll_and_get_state(button_id, user_id):
+    """Delete a roll and return what's needed to refresh the public message.
+
+    Runs in one transaction, so the returned list is exactly the state the
+    delete left behind. Returns a dict with deleted, channel_id, message_id,
+    is_open and rolls; channel_id/message_id are None if the button message
+    is unknown.
+    """
+    db_pool = await get_db_pool()
+    with roll_cache.loading(button_id):
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                deleted = await conn.prepared["delete_roll"].fetchval(button_id, user_id)
+                rows = await conn.prepared["get_button_state"].fetch(button_id)
+        note_write(button_id)
+
+        rolls = [
+            {
+                "user_id": r["user_id"],
+                "user_display_name": r["user_display_name"],
+                "roll": r["roll"],
+                "timestamp": r["timestamp"]
+            }
+            for r in rows if r["user_id"] is not None
+        ]
+        if rows:
+            roll_cache.set(button_id, rolls)
+        else:
+            roll_cache.remove_roll(button_id, user_id)
+
+    return {
+        "deleted": deleted is not None,
+        "channel_id": rows[0]["channel_id"] if rows else None,
+        "message_id": rows[0]["message_id"] if rows else None,
+        "is_open": bool(rows) and rows[0]["status"] == "open",
+        "rolls": rolls
+    }
+
+@timed_query
+async def heartbeat_instance(instance_id, shard_weight, stale_after):
+    """Record this process as alive and return the shard weight of every live process"""
+    db_pool = await get_db_pool()
+    async with db_pool.acquire() as conn:
+        return await conn.fetchval(
+            """
+            WITH beat AS (
+                INSERT INTO bot_instances (instance_id, shard_weight, last_seen)
+                VALUES ($1, $2, CURRENT_TIMESTAMP)
+                ON CONFLICT (instance_id) DO UPDATE
+                SET shard_weight = EXCLUDED.shard_weight, last_seen = EXCLUDED.last_seen
+            )
+            SELECT $2 + COALESCE(SUM(shard_weight), 0) FROM bot_instances
+            WHERE instance_id <> $1 AND last_seen > CURRENT_TIMESTAMP - make_interval(secs => $3)
+            """,
+            instance_id, shard_weight, stale_after
         )
-        return True
\ No newline at end of file
@@ -0,0 +1,90 @@
+# SQL for the hot paths, prepared on every pooled connection at connect time
+
+# Inserts only land on open buttons; closed ones return no row, like a duplicate
+INSERT_ROLL = """
+    INSERT INTO rolls (button_id, user_id, user_display_name, roll)
+    SELECT $1, $2::BIGINT, $3::TEXT, $4::INTEGER FROM button_messages
+    WHERE button_id = $1 AND status = 'open'
+    ON CONFLICT (button_id, user_id) DO NOTHING
+    RETURNING user_id, user_display_name, roll, timestamp
+"""
+
+# The outer SELECT runs on the statement snapshot, so it sees every existing
+# roll but not the one inserted by the CTE; UNION adds it back
+INSERT_ROLL_AND_GET_ROLLS = """
+    WITH inserted AS (
+        INSERT INTO rolls (button_id, user_id, user_display_name, roll)
+        SELECT $1, $2::BIGINT, $3::TEXT, $4::INTEGER FROM button_messages
+        WHERE button_id = $1 AND status = 'open'
+        ON CONFLICT (button_id, user_id) DO NOTHING
+        RETURNING id, user_id, user_display_name, roll, timestamp
+    )
+    SELECT id, user_id, user_display_name, roll, timestamp, FALSE AS is_new
+    FROM rolls WHERE button_id = $1
+    UNION ALL
+    SELECT id, user_id, user_display_name, roll, timestamp, TRUE AS is_new FROM inserted
+    ORDER BY id
+"""
+
+GET_ROLLS = """
+    SELECT user_id, user_display_name, roll, timestamp FROM rolls WHERE button_id = $1 ORDER BY id
+"""
+
+GET_RECENT_ROLLS = """
+    SELECT id, user_id, user_display_name, roll, timestamp FROM rolls
+    WHERE button_id = $1
+    ORDER BY timestamp DESC, id DESC
+    LIMIT $2
+"""
+
+GET_ROLL_STATS = """
+    SELECT m.channel_id, m.message_id,
+           s.roll_count, s.roll_sum, s.min_roll, s.max_roll, s.last_roll_at
+    FROM (SELECT $1::UUID AS button_id) b
+    LEFT JOIN button_messages m ON m.button_id = b.button_id
+    LEFT JOIN button_stats s ON s.button_id = b.button_id
+"""
+
+IS_BUTTON_OPEN = """
+    SELECT status = 'open' FROM button_messages WHERE button_id = $1
+"""
+
+GET_BUTTON_ID_BY_MESSAGE = """
+    SELECT button_id FROM button_messages WHERE message_id = $1
+"""
+
+DELETE_ROLL = """
+    DELETE FROM rolls WHERE button_id = $1 AND user_id = $2 RETURNING id
+"""
+
+GET_BUTTON_STATE = """
+    SELECT m.channel_id, m.message_id, m.status,
+           r.user_id, r.user_display_name, r.roll, r.timestamp
+    FROM button_messages m
+    LEFT JOIN rolls r ON r.button_id = m.button_id
+    WHERE m.button_id = $1
+    ORDER BY r.id
+"""
+
+PREPARED_QUERIES = {
+    "insert_roll": INSERT_ROLL,
+    "insert_roll_and_get_rolls": INSERT_ROLL_AND_GET_ROLLS,
+    "get_rolls": GET_ROLLS,
+    "get_recent_rolls": GET_RECENT_ROLLS,
+    "get_roll_stats": GET_ROLL_STATS,
+    "get_button_id_by_message": GET_BUTTON_ID_BY_MESSAGE,
+    "is_button_open": IS_BUTTON_OPEN,
+    "delete_roll": DELETE_ROLL,
+    "get_button_state": GET_BUTTON_STATE,
+}
+
+# Statements a read replica serves; writes always go to the primary
+REPLICA_QUERIES = ("get_rolls", "get_recent_rolls", "get_roll_stats")
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::FLOAT
+    END
+"""
@@ -1,6 +1,8 @@
+import asyncio
 import discord
+import threading
 from discord import app_commands
-from utils.rate_limiter import rate_limiter
+from config import AUTHORIZED_ADMIN_IDS
 import logging
 
 logger = logging.getLogger('discord_bot')
@@ -11,12 +13,32 @@ def register_commands(bot):
         # Import here to avoid circular imports
         from ui.roll_button import RollButton
         from db.operations import save_button_message
+        from utils.startup import ensure_ready
+        
+        if not await ensure_ready(interaction):
+            return
         
         view = RollButton()
         
-        # Apply rate limiting before sending
-        await rate_limiter.acquire()
+        # Interaction responses have their own bucket, outside the global limit
         await interaction.response.send_message("🎲 Click the button to roll!", view=view)
         message = await interaction.original_response()
 
-        await save_button_message(view.button_id, interaction.channel.id, message.id)
\ No newline at end of file
+        await save_button_message(view.button_id, interaction.channel.id, message.id)
+
+    @bot.tree.command(name="profile", description="Sample the event loop and report the busiest functions (admins only)")
+    @app_commands.describe(seconds="How long to sample for")
+    async def profile(interaction: discord.Interaction, seconds: app_commands.Range[int, 1, 60] = 10):
+        # Import here to avoid circular imports
+        from utils.loop_monitor import sample_profile, format_profile
+        
+        if interaction.user.id not in AUTHORIZED_ADMIN_IDS:
+            await interaction.response.send_message("⛔ You're not authorized to profile the bot.", ephemeral=True)
+            return
+        
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        
+        # The sampler runs in a worker thread and reads this (the loop) thread's stack
+        logger.info(f"{interaction.user} started a {seconds}s profile")
+        result = await asyncio.to_thread(sample_profile, threading.get_ident(), seconds)
+        await interaction.followup.send(format_profile(seconds, *result), ephemeral=True)
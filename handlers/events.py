@@ -1,9 +1,63 @@
+import asyncio
 import discord
 import logging
-from utils.rate_limiter import rate_limiter
+from config import VIEW_VERIFY_LIMIT, VIEW_VERIFY_CONCURRENCY
+from utils.rate_limiter import rate_limiter, handle_api_error
 
 logger = logging.getLogger('discord_bot')
 
+def register_views(bot):
+    """Register the dynamic roll/stats items that serve every posted button"""
+    # Import here to avoid circular imports
+    from ui.roll_button import RollDynamicButton, StatsDynamicButton
+
+    # Routing comes from the custom_id, so this is all the restoration
+    # needed no matter how many buttons have been posted
+    bot.add_dynamic_items(RollDynamicButton, StatsDynamicButton)
+    logger.info("Registered dynamic roll button handlers")
+
+async def verify_button_messages(bot):
+    """Check that the most recent button messages still exist, a few at a time"""
+    # Import here to avoid circular imports
+    from db.operations import get_recent_button_messages
+    from utils.startup import startup
+
+    # The gateway can come up before the database does
+    await startup.db_ready.wait()
+    try:
+        rows = await get_recent_button_messages(VIEW_VERIFY_LIMIT)
+    except Exception as e:
+        logger.error(f"Button message verification failed: {e}")
+        return
+
+    semaphore = asyncio.Semaphore(VIEW_VERIFY_CONCURRENCY)
+    missing = 0
+    skipped = 0
+
+    async def verify(row):
+        nonlocal missing, skipped
+        channel = bot.get_channel(row["channel_id"])
+        if channel is None:
+            # Not visible to this process - another shard owns it, or we lost access
+            skipped += 1
+            return
+        route = f"channel:{row['channel_id']}"
+        async with semaphore:
+            try:
+                await rate_limiter.acquire(route)
+                await channel.fetch_message(row["message_id"])
+            except discord.NotFound:
+                missing += 1
+                logger.warning(f"Message {row['message_id']} not found - may have been deleted")
+            except discord.Forbidden:
+                logger.warning(f"Forbidden to access message {row['message_id']}")
+            except discord.HTTPException as e:
+                await handle_api_error(e, route=route)
+                logger.warning(f"Failed to verify message {row['message_id']}: {e}")
+
+    await asyncio.gather(*(verify(row) for row in rows))
+    logger.info(f"Verified {len(rows) - skipped} recent button messages, {missing} missing, {skipped} not visible to this process")
+
 def register_events(bot):
     # Import here to avoid circular imports
     from handlers.commands import register_commands
@@ -13,43 +67,28 @@ def register_events(bot):
     
     @bot.event
     async def on_ready():
+        # Import here to avoid circular imports
+        from utils.startup import startup
+        
         logger.info(f"Logged in as {bot.user}")
-        try:
-            await bot.tree.sync()
-            logger.info("Synced slash commands")
-        except Exception as e:
-            logger.error(f"Slash sync failed: {e}")
-
-        try:
-            # Import here to avoid circular imports
-            from db.operations import get_button_messages
-            from ui.roll_button import RollButton
-            
-            # Rate limit this operation
-            await rate_limiter.acquire()
-            rows = await get_button_messages()
-
-            for row in rows:
-                # Apply rate limiting for each fetch and edit
-                await rate_limiter.acquire()
-                channel = bot.get_channel(row["channel_id"])
-                if channel:
-                    try:
-                        await rate_limiter.acquire()
-                        msg = await channel.fetch_message(row["message_id"])
-                        view = RollButton(button_id=row["button_id"])
-                        
-                        await rate_limiter.acquire()
-                        await msg.edit(view=view)
-                        logger.info(f"Restored view on message {msg.id}")
-                    except discord.NotFound:
-                        logger.warning(f"Message {row['message_id']} not found - may have been deleted")
-                    except discord.Forbidden:
-                        logger.warning(f"Forbidden to access message {row['message_id']}")
-                    except Exception as e:
-                        logger.warning(f"Failed to restore message {row['message_id']}: {e}")
-        except Exception as e:
-            logger.error(f"View restore error: {e}")
+        startup.mark("gateway")
+        
+        # Commands are global; sync once, from the process that owns shard 0
+        shard_ids = getattr(bot, "shard_ids", None)
+        owns_first_shard = not shard_ids or 0 in shard_ids
+        if owns_first_shard and not getattr(bot, "commands_synced", False):
+            try:
+                await bot.tree.sync()
+                bot.commands_synced = True
+                logger.info("Synced slash commands")
+            except Exception as e:
+                logger.error(f"Slash sync failed: {e}")
+
+        # on_ready fires again on every reconnect; buttons are already routed
+        # by the dynamic items, so only the one-off existence check runs here
+        if not getattr(bot, "views_verified", False):
+            bot.views_verified = True
+            bot.loop.create_task(verify_button_messages(bot))
 
     @bot.event
     async def on_error(event, *args, **kwargs):
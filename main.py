@@ -1,47 +1,72 @@
 import asyncio
 import logging
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, SHARD_COUNT, SHARD_IDS, LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE,
+    LOG_RATE_LIMIT_INTERVAL, LOG_RATE_LIMIT_BURST, SLOW_INTERACTION_THRESHOLD_MS,
+    SLOW_TRACE_PATH, SLOW_TRACE_MAX_BYTES, SLOW_TRACE_BACKUPS
+)
+from utils.log_pipeline import setup_logging, setup_trace_log
 from db.connection import setup_database
 from tasks.background import start_background_tasks
+from utils.startup import startup
+from utils.rate_limiter import rate_limit_trace
 import discord
 from discord.ext import commands
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Set up logging - records are queued and written by a background thread
+log_listener = setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_LIMIT_INTERVAL, LOG_RATE_LIMIT_BURST)
+trace_listener = setup_trace_log(SLOW_TRACE_PATH, SLOW_TRACE_MAX_BYTES, SLOW_TRACE_BACKUPS) if SLOW_INTERACTION_THRESHOLD_MS else None
 logger = logging.getLogger('discord_bot')
 
 # Configure intents
 intents = discord.Intents.default()
 intents.members = True
 
-# Configure bot
-bot = commands.Bot(command_prefix="/", intents=intents)
+# Configure bot - sharded when SHARD_COUNT is set
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix="/",
+        intents=intents,
+        shard_count=None if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+        shard_ids=SHARD_IDS,
+        http_trace=rate_limit_trace()
+    )
+else:
+    bot = commands.Bot(command_prefix="/", intents=intents, http_trace=rate_limit_trace())
 
-async def init_bot():
-    # Setup database
-    success = await setup_database(bot)
+async def init_database():
+    # Connection, migrations and the change listener; clicks wait on this
+    with startup.stage("database"):
+        success = await setup_database(bot)
     if not success:
-        return False
+        logger.critical("Failed to initialize database")
+        await bot.close()
+        return
+    startup.db_ready.set()
     
+    # Start background tasks - most of them need the database
+    with startup.stage("background_tasks"):
+        await start_background_tasks(bot)
+
+async def init_bot():
     # Register events (import here to avoid circular imports)
-    from handlers.events import register_events
-    register_events(bot)
-    
-    # Start background tasks
-    await start_background_tasks(bot)
+    from handlers.events import register_events, register_views
+    with startup.stage("views"):
+        register_events(bot)
+        register_views(bot)
     
-    return True
+    # The database comes up while the gateway connects; setup_hook has to
+    # return before discord.py opens the gateway, so don't wait for it here
+    bot.db_setup_task = asyncio.create_task(init_database())
 
 def main():
     @bot.event
     async def setup_hook():
-        success = await init_bot()
-        if not success:
-            logger.critical("Failed to initialize bot")
-            await bot.close()
+        await init_bot()
     
     try:
-        bot.run(BOT_TOKEN)
+        # log_handler=None keeps discord.py from adding its own synchronous handler
+        bot.run(BOT_TOKEN, log_handler=None)
     except discord.errors.LoginFailure:
         logger.critical("Invalid token provided")
     except discord.errors.HTTPException as e:
@@ -51,6 +76,11 @@ def main():
             logger.critical(f"HTTP Exception: {e}")
     except Exception as e:
         logger.critical(f"Failed to start bot: {e}")
+    finally:
+        # Flush whatever is still queued
+        if trace_listener:
+            trace_listener.stop()
+        log_listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
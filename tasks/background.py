@@ -1,5 +1,16 @@
+import os
+import socket
+import asyncio
+import datetime
 import logging
+import discord
 from discord.ext import tasks
+from config import (
+    METRICS_HOST, METRICS_PORT, SHARD_COUNT, BUTTON_EXPIRY_DAYS,
+    ARCHIVE_INTERVAL_MINUTES, ARCHIVE_BATCH_SIZE, ARCHIVE_MAX_BATCHES,
+    DATABASE_REPLICA_URL, REPLICA_CHECK_INTERVAL, ROLL_JOURNAL_PATH,
+    LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD_MS
+)
 from utils.rate_limiter import rate_limiter
 
 logger = logging.getLogger('discord_bot')
@@ -22,28 +33,173 @@ async def monitor_rate_limits():
             logger.warning(f"High API usage detected: {stats['current_window']}/{stats['max_per_window']} " +
                           f"({stats['current_window']/stats['max_per_window']*100:.1f}%)")
 
-# Background task for database connection health checks
-@tasks.loop(minutes=5)
-async def check_db_connection():
+# Event loop lag - the watchdog thread logs the blocking stack while a stall is happening
+@tasks.loop(seconds=LOOP_LAG_INTERVAL)
+async def monitor_event_loop():
+    # Import here to avoid circular imports
+    from utils.loop_monitor import loop_watchdog
+    
+    loop_watchdog.beat()
+    
+    # Summarize about once a minute, or every beat when beats are further apart
+    if monitor_event_loop.current_loop % max(1, round(60 / LOOP_LAG_INTERVAL)) == 0:
+        stats = loop_watchdog.get_stats()
+        if stats["max_lag"] * 1000 >= LOOP_LAG_THRESHOLD_MS:
+            logger.warning(f"Event loop max lag {stats['max_lag'] * 1000:.0f}ms this minute, " +
+                           f"{stats['stalls']} stalls since startup")
+
+@monitor_event_loop.before_loop
+async def start_loop_watchdog():
+    # Import here to avoid circular imports
+    from utils.loop_monitor import loop_watchdog
+    
+    loop_watchdog.start()
+
+# Pool statistics - replaces the old periodic SELECT 1 health check
+@tasks.loop(minutes=1)
+async def monitor_db_pool():
     # Import here to avoid circular imports
     from db.connection import get_db_pool
     
     db_pool = await get_db_pool()
-    if db_pool:
-        try:
-            async with db_pool.acquire() as conn:
-                await conn.execute("SELECT 1")
-            logger.info("Database connection check: OK")
-        except Exception as e:
-            logger.error(f"Database connection check failed: {e}")
+    if not db_pool:
+        return
+    
+    stats = db_pool.get_stats()
+    failed = stats["failed_acquires"] - monitor_db_pool.last_failed_acquires
+    monitor_db_pool.last_failed_acquires = stats["failed_acquires"]
+    
+    logger.info(f"DB pool: {stats['in_use']}/{stats['size']} in use (max {stats['max_size']}), " +
+                f"avg acquire wait {stats['avg_acquire_wait'] * 1000:.1f}ms, " +
+                f"max {stats['max_acquire_wait'] * 1000:.1f}ms this minute")
+    if failed:
+        logger.error(f"DB pool: {failed} failed connection acquires in the last minute")
+    elif stats["in_use"] >= stats["max_size"]:
+        logger.warning("DB pool exhausted - every connection is in use")
+
+monitor_db_pool.last_failed_acquires = 0
+
+# Replica lag probe - reads move off the replica while it's behind or down
+@tasks.loop(seconds=REPLICA_CHECK_INTERVAL)
+async def monitor_replica():
+    # Import here to avoid circular imports
+    from db.connection import check_replica
+    
+    await check_replica()
+
+# Instance identity for splitting the bot-wide rate limit between processes
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+INSTANCE_STALE_AFTER = 45  # seconds without a heartbeat before an instance stops counting
+
+@tasks.loop(seconds=15)
+async def sync_rate_limit_share(bot):
+    # Import here to avoid circular imports
+    from db.operations import heartbeat_instance
+
+    # Weight each process by the shards it owns, so bigger processes get more budget
+    shard_weight = len(bot.shard_ids) if getattr(bot, "shard_ids", None) else (bot.shard_count or 1)
+    try:
+        total_weight = await heartbeat_instance(INSTANCE_ID, shard_weight, INSTANCE_STALE_AFTER)
+    except Exception as e:
+        logger.error(f"Instance heartbeat failed: {e}")
+        return
+
+    share = shard_weight / total_weight if total_weight else 1.0
+    if abs(share - rate_limiter.share) > 0.001:
+        logger.info(f"Rate limit share now {share:.0%} ({shard_weight}/{total_weight} shards)")
+    rate_limiter.set_share(share)
+
+async def close_button_message(bot, button_id, channel_id, message_id):
+    """Strip the buttons from a closed roll message; True once the edit landed.
+
+    Goes through the edit scheduler like every other edit of the message, so
+    it replaces a roll refresh that was still waiting to run.
+    """
+    # Import here to avoid circular imports
+    from ui.roll_button import schedule_refresh
+    
+    msg = bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+    return await schedule_refresh(button_id, msg, is_open=False)
+
+# Replays rolls accepted by the write-behind journal while the database was down
+@tasks.loop(seconds=2)
+async def replay_roll_journal():
+    # Import here to avoid circular imports
+    from db.journal import roll_journal
+    
+    if not roll_journal.entries:
+        return
+    try:
+        await roll_journal.replay()
+    except Exception as e:
+        # Still unavailable; the next tick tries again
+        logger.warning(f"Roll journal replay failed, {roll_journal.backlog()} rolls waiting: {e!r}")
+
+# Close expired buttons and move their rolls to the archive, a batch at a time
+@tasks.loop(minutes=ARCHIVE_INTERVAL_MINUTES)
+async def compact_closed_buttons(bot):
+    # Import here to avoid circular imports
+    from db.operations import close_expired_buttons, archive_closed_rolls
+    
+    try:
+        if BUTTON_EXPIRY_DAYS > 0:
+            cutoff = discord.utils.time_snowflake(
+                discord.utils.utcnow() - datetime.timedelta(days=BUTTON_EXPIRY_DAYS)
+            )
+            # The messages are left alone: editing them in bulk would burn the
+            # channel rate limits, and a click on one is already answered "closed"
+            closed = await close_expired_buttons(cutoff, ARCHIVE_BATCH_SIZE)
+            if closed:
+                logger.info(f"Closed {len(closed)} expired roll buttons")
+        
+        archived = 0
+        for _ in range(ARCHIVE_MAX_BATCHES):
+            moved = await archive_closed_rolls(ARCHIVE_BATCH_SIZE)
+            archived += moved
+            if moved < ARCHIVE_BATCH_SIZE:
+                break
+            # Short transactions with gaps between them keep lock waits negligible
+            await asyncio.sleep(0.1)
+        if archived:
+            logger.info(f"Archived {archived} rolls of closed buttons")
+    except Exception as e:
+        logger.error(f"Roll archival failed: {e}")
 
 async def start_background_tasks(bot):
     # Attach tasks to bot for reference
     bot.monitor_task = monitor_rate_limits
-    bot.db_check_task = check_db_connection
+    bot.db_pool_task = monitor_db_pool
+    bot.loop_lag_task = monitor_event_loop
     
     # Start background tasks
     monitor_rate_limits.start()
-    check_db_connection.start()
+    monitor_db_pool.start()
+    monitor_event_loop.start()
+    
+    if DATABASE_REPLICA_URL:
+        bot.replica_task = monitor_replica
+        monitor_replica.start()
+    
+    if ROLL_JOURNAL_PATH:
+        bot.journal_task = replay_roll_journal
+        replay_roll_journal.start()
+    
+    # Button expiry and roll archival
+    bot.archive_task = compact_closed_buttons
+    compact_closed_buttons.start(bot)
+    
+    # Processes running separate shard ranges split the global rate limit
+    if SHARD_COUNT:
+        bot.rate_share_task = sync_rate_limit_share
+        sync_rate_limit_share.start(bot)
+    
+    # Optional Prometheus endpoint
+    if METRICS_PORT:
+        from utils.metrics import register_runtime_gauges, start_metrics_server
+        register_runtime_gauges(bot)
+        try:
+            bot.metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            logger.error(f"Failed to start metrics server on port {METRICS_PORT}: {e}")
     
     return True
\ No newline at end of file
@@ -0,0 +1,111 @@
+import asyncio
+import contextlib
+import uuid
+import pytest
+import db.batch_writer
+from db.batch_writer import RollBatchWriter
+
+BUTTON = uuid.uuid4()
+CLOSED_BUTTON = uuid.uuid4()
+
+
+class FakePool:
+    """Answers the group-commit INSERT like Postgres: open buttons only, first row per (button, user)"""
+    def __init__(self):
+        self.rows = {}  # (button_id, user_id) -> roll
+        self.statements = 0
+        self.fail = False
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def fetch(self, query, button_ids, user_ids, names, rolls):
+        self.statements += 1
+        if self.fail:
+            raise ConnectionRefusedError("database is down")
+        inserted = []
+        for button_id, user_id, name, roll in zip(button_ids, user_ids, names, rolls):
+            key = (button_id, user_id)
+            if button_id == BUTTON and key not in self.rows:
+                self.rows[key] = roll
+                inserted.append({
+                    "button_id": button_id, "user_id": user_id,
+                    "user_display_name": name, "roll": roll, "timestamp": None
+                })
+        return inserted
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+
+    async def get_db_pool():
+        return pool
+    monkeypatch.setattr(db.batch_writer, "get_db_pool", get_db_pool)
+    return pool
+
+
+def test_concurrent_inserts_share_one_statement(pool):
+    writer = RollBatchWriter(0.01, 100)
+
+    async def run():
+        return await asyncio.gather(*(writer.insert(BUTTON, user_id, f"user {user_id}", user_id) for user_id in range(5)))
+
+    rows = asyncio.run(run())
+    assert pool.statements == 1
+    assert [r["roll"] for r in rows] == [0, 1, 2, 3, 4]
+    assert writer.get_stats() == {"batches": 1, "rows": 5, "pending": 0}
+
+def test_only_the_first_duplicate_in_a_batch_wins(pool):
+    writer = RollBatchWriter(0.01, 100)
+
+    async def run():
+        return await asyncio.gather(
+            writer.insert(BUTTON, 1, "alice", 40),
+            writer.insert(BUTTON, 1, "alice", 90),
+        )
+
+    first, second = asyncio.run(run())
+    assert first["roll"] == 40
+    assert second is None
+    assert pool.rows == {(BUTTON, 1): 40}
+
+def test_existing_rolls_and_closed_buttons_get_none(pool):
+    pool.rows[(BUTTON, 1)] = 77
+    writer = RollBatchWriter(0.01, 100)
+
+    async def run():
+        return await asyncio.gather(
+            writer.insert(BUTTON, 1, "alice", 40),
+            writer.insert(CLOSED_BUTTON, 2, "bob", 10),
+        )
+
+    assert asyncio.run(run()) == [None, None]
+    assert pool.rows == {(BUTTON, 1): 77}
+
+def test_a_full_batch_flushes_without_waiting(pool):
+    writer = RollBatchWriter(10, 2)
+
+    async def run():
+        return await asyncio.wait_for(
+            asyncio.gather(writer.insert(BUTTON, 1, "alice", 40), writer.insert(BUTTON, 2, "bob", 10)),
+            1
+        )
+
+    assert all(asyncio.run(run()))
+    assert pool.statements == 1
+
+def test_a_failed_flush_fails_every_caller(pool):
+    pool.fail = True
+    writer = RollBatchWriter(0.01, 100)
+
+    async def run():
+        return await asyncio.gather(
+            writer.insert(BUTTON, 1, "alice", 40),
+            writer.insert(BUTTON, 2, "bob", 10),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ConnectionRefusedError) for r in results)
@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from utils.button_actors import ActorExecutor
+
+
+class RecordingHandler:
+    """Handler that records each batch it gets and returns the items doubled"""
+    def __init__(self, delay=0.01, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []  # (key, items)
+
+    async def __call__(self, key, items):
+        self.batches.append((key, list(items)))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("batch failed")
+        return [item * 2 for item in items]
+
+
+def test_items_for_one_button_are_handled_in_submission_order():
+    handler = RecordingHandler()
+    actors = ActorExecutor(handler, queue_size=100, batch_size=3, idle_timeout=1)
+
+    async def run():
+        return await asyncio.gather(*[actors.submit("button", i) for i in range(7)])
+
+    assert asyncio.run(run()) == [0, 2, 4, 6, 8, 10, 12]
+    handled = [item for _, items in handler.batches for item in items]
+    assert handled == list(range(7))
+    assert all(len(items) <= 3 for _, items in handler.batches)
+
+def test_items_queued_during_a_batch_are_handled_together():
+    handler = RecordingHandler(delay=0.05)
+    actors = ActorExecutor(handler, queue_size=100, batch_size=10, idle_timeout=1)
+
+    async def run():
+        first = actors.submit("button", 1)
+        await asyncio.sleep(0.01)
+        rest = [actors.submit("button", i) for i in range(2, 6)]
+        await asyncio.gather(first, *rest)
+
+    asyncio.run(run())
+    assert [items for _, items in handler.batches] == [[1], [2, 3, 4, 5]]
+
+def test_buttons_run_in_parallel():
+    handler = RecordingHandler(delay=0.05)
+    actors = ActorExecutor(handler, queue_size=100, batch_size=10, idle_timeout=1)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(*[actors.submit(f"button {i}", i) for i in range(5)])
+        return loop.time() - start
+
+    assert asyncio.run(run()) < 0.2
+    assert len(handler.batches) == 5
+
+def test_a_full_queue_rejects_new_items():
+    handler = RecordingHandler(delay=0.05)
+    actors = ActorExecutor(handler, queue_size=2, batch_size=1, idle_timeout=1)
+
+    async def run():
+        futures = [actors.submit("button", i) for i in range(3)]
+        accepted = [f for f in futures if f is not None]
+        await asyncio.gather(*accepted)
+        return futures
+
+    futures = asyncio.run(run())
+    assert futures[2] is None
+    assert actors.get_stats()["throttled"] == 1
+
+def test_a_failed_batch_fails_its_items_and_the_actor_keeps_going():
+    handler = RecordingHandler(fail=True)
+    actors = ActorExecutor(handler, queue_size=100, batch_size=10, idle_timeout=1)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await actors.submit("button", 1)
+        handler.fail = False
+        return await actors.submit("button", 2)
+
+    assert asyncio.run(run()) == 4
+
+def test_idle_actors_exit():
+    handler = RecordingHandler(delay=0)
+    actors = ActorExecutor(handler, queue_size=100, batch_size=10, idle_timeout=0.02)
+
+    async def run():
+        await actors.submit("button", 1)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert actors.get_stats()["active"] == 0
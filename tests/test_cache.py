@@ -0,0 +1,81 @@
+from db.cache import RollCache
+
+
+def roll(user_id, value=50):
+    return {"user_id": user_id, "user_display_name": f"user {user_id}", "roll": value, "timestamp": None}
+
+def change(op, user_id, value=50, button_id="button"):
+    return dict(roll(user_id, value), op=op, button_id=button_id)
+
+def users(cache, button_id="button"):
+    return [r["user_id"] for r in cache.get(button_id)]
+
+
+def test_change_notified_during_a_load_is_replayed_after_set():
+    cache = RollCache(10)
+    with cache.loading("button"):
+        # Committed after the load's snapshot, notified before the load finished
+        cache.apply_change(change("insert", 2))
+        cache.set("button", [roll(1)])
+    assert users(cache) == [1, 2]
+    assert not cache.loads
+
+def test_replay_is_idempotent_when_the_snapshot_already_has_the_change():
+    cache = RollCache(10)
+    with cache.loading("button"):
+        cache.apply_change(change("insert", 2))
+        cache.set("button", [roll(1), roll(2)])
+    assert users(cache) == [1, 2]
+
+def test_replay_applies_changes_in_notification_order():
+    cache = RollCache(10)
+    with cache.loading("button"):
+        cache.apply_change(change("insert", 2))
+        cache.apply_change(change("delete", 2))
+        cache.apply_change(change("insert", 3))
+        cache.set("button", [roll(1), roll(2)])
+    assert users(cache) == [1, 3]
+
+def test_overlapping_loads_keep_buffering_until_the_last_one_ends():
+    cache = RollCache(10)
+    with cache.loading("button"):
+        with cache.loading("button"):
+            cache.apply_change(change("insert", 2))
+            cache.set("button", [roll(1)])
+        cache.set("button", [roll(1)])
+    assert users(cache) == [1, 2]
+    assert not cache.loads
+
+def test_a_failed_load_stops_buffering():
+    cache = RollCache(10)
+    try:
+        with cache.loading("button"):
+            raise ConnectionRefusedError()
+    except ConnectionRefusedError:
+        pass
+    assert not cache.loads
+
+def test_insert_for_an_uncached_button_without_a_load_is_ignored():
+    cache = RollCache(10)
+    cache.apply_change(change("insert", 1))
+    assert cache.get("button") is None
+    assert cache.has_rolled("button", 1) is None
+
+def test_duplicate_insert_notifications_do_not_change_the_version():
+    cache = RollCache(10)
+    cache.set("button", [roll(1)])
+    version = cache.version("button")
+    cache.apply_change(change("insert", 1))
+    assert cache.version("button") == version
+    cache.apply_change(change("insert", 2))
+    assert cache.version("button") != version
+
+def test_least_recently_used_button_is_evicted():
+    cache = RollCache(2)
+    cache.set("a", [roll(1)])
+    cache.set("b", [roll(1)])
+    cache.get("a")
+    cache.set("c", [roll(1)])
+    assert cache.get("b") is None
+    assert cache.version("b") is None
+    assert users(cache, "a") == [1]
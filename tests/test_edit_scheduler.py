@@ -0,0 +1,78 @@
+import asyncio
+from utils.edit_scheduler import EditScheduler
+
+INTERVAL = 0.05
+
+
+def recorder(log, label, fail=False):
+    async def edit():
+        log.append(label)
+        if fail:
+            raise RuntimeError("edit failed")
+    return edit
+
+
+def test_first_edit_runs_immediately():
+    scheduler = EditScheduler(INTERVAL)
+    log = []
+
+    async def run():
+        done = scheduler.schedule("button", recorder(log, "first"))
+        await asyncio.sleep(0.01)
+        assert log == ["first"]
+        return await done
+
+    assert asyncio.run(run()) is True
+
+def test_edits_during_the_cooldown_coalesce_and_the_newest_wins():
+    scheduler = EditScheduler(INTERVAL)
+    log = []
+
+    async def run():
+        first = scheduler.schedule("button", recorder(log, "first"))
+        await asyncio.sleep(0.01)
+        later = [scheduler.schedule("button", recorder(log, f"edit {i}")) for i in range(5)]
+        return await asyncio.gather(first, *later)
+
+    results = asyncio.run(run())
+    assert log == ["first", "edit 4"]
+    assert results == [True] * 6
+    assert scheduler.get_stats() == {"requested": 6, "performed": 2, "failed": 0, "active": 0}
+
+def test_keys_are_coalesced_independently():
+    scheduler = EditScheduler(INTERVAL)
+    log = []
+
+    async def run():
+        await asyncio.gather(
+            scheduler.schedule("a", recorder(log, "a1")),
+            scheduler.schedule("b", recorder(log, "b1")),
+            scheduler.schedule("a", recorder(log, "a2")),
+        )
+
+    asyncio.run(run())
+    # a1 was replaced before a's worker got to run; b is untouched by it
+    assert sorted(log) == ["a2", "b1"]
+
+def test_a_failed_edit_resolves_its_waiters_false():
+    scheduler = EditScheduler(INTERVAL)
+    log = []
+
+    async def run():
+        failed = scheduler.schedule("button", recorder(log, "broken", fail=True))
+        await asyncio.sleep(0.01)
+        recovered = scheduler.schedule("button", recorder(log, "fixed"))
+        return await asyncio.gather(failed, recovered)
+
+    assert asyncio.run(run()) == [False, True]
+    assert scheduler.failed == 1
+
+def test_worker_exits_once_nothing_is_pending():
+    scheduler = EditScheduler(INTERVAL)
+
+    async def run():
+        await scheduler.schedule("button", recorder([], "only"))
+        await asyncio.sleep(INTERVAL * 2)
+
+    asyncio.run(run())
+    assert not scheduler.workers
@@ -0,0 +1,178 @@
+import asyncio
+import uuid
+import pytest
+import db.operations
+from db.cache import roll_cache
+from db.journal import RollJournal
+
+BUTTON = str(uuid.uuid4())
+CLOSED_BUTTON = str(uuid.uuid4())
+
+
+class FakeRolls:
+    """The rolls table as the replay INSERT sees it: one row per (button, user), open buttons only"""
+    def __init__(self, open_buttons):
+        self.open_buttons = set(open_buttons)
+        self.rows = {}  # (button_id, user_id) -> roll
+        self.fail = False
+
+    async def insert(self, batch):
+        if self.fail:
+            raise ConnectionRefusedError("database is down")
+        inserted = []
+        for e in batch:
+            key = (e["button_id"], e["user_id"])
+            if e["button_id"] in self.open_buttons and key not in self.rows:
+                self.rows[key] = e["roll"]
+                inserted.append({"button_id": uuid.UUID(e["button_id"]), "user_id": e["user_id"]})
+        return inserted
+
+
+def make_journal(tmp_path, rolls):
+    journal = RollJournal(str(tmp_path / "rolls.jsonl"), 0.001, 100, 2)
+    journal.load()
+    journal._insert = rolls.insert
+    return journal
+
+def journal_lines(journal):
+    with open(journal.path, encoding="utf-8") as f:
+        return f.readlines()
+
+
+def test_append_refuses_a_second_roll_while_journaled(tmp_path):
+    journal = make_journal(tmp_path, FakeRolls([BUTTON]))
+
+    async def run():
+        first = await journal.append(BUTTON, 1, "alice", 40)
+        second = await journal.append(BUTTON, 1, "alice", 90)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["roll"] == 40
+    assert second is None
+    assert journal.backlog() == 1
+    assert len(journal_lines(journal)) == 1
+
+def test_replay_inserts_in_order_and_drops_conflicts(tmp_path):
+    rolls = FakeRolls([BUTTON])
+    rolls.rows[(BUTTON, 2)] = 77  # committed before the outage
+    journal = make_journal(tmp_path, rolls)
+
+    async def run():
+        await journal.append(BUTTON, 1, "alice", 40)
+        await journal.append(BUTTON, 2, "bob", 10)
+        await journal.append(CLOSED_BUTTON, 3, "carol", 55)
+        await journal.append(BUTTON, 4, "dave", 60)
+        await journal.replay()
+
+    asyncio.run(run())
+    assert rolls.rows == {(BUTTON, 1): 40, (BUTTON, 2): 77, (BUTTON, 4): 60}
+    assert journal.replayed == 4
+    assert journal.dropped == 2
+    assert journal.backlog() == 0
+    assert not journal.keys
+    assert journal_lines(journal) == []
+
+def test_replay_invalidates_the_cache_of_a_dropped_roll(tmp_path):
+    rolls = FakeRolls([BUTTON])
+    rolls.rows[(BUTTON, 1)] = 77
+    journal = make_journal(tmp_path, rolls)
+    roll_cache.set(BUTTON, [])
+
+    async def run():
+        inserted = await journal.append(BUTTON, 1, "alice", 40)
+        roll_cache.add_roll(BUTTON, inserted)
+        await journal.replay()
+
+    asyncio.run(run())
+    assert roll_cache.get(BUTTON) is None
+
+def test_replaying_a_reloaded_journal_twice_is_harmless(tmp_path):
+    rolls = FakeRolls([BUTTON])
+    journal = make_journal(tmp_path, rolls)
+
+    async def run():
+        await journal.append(BUTTON, 1, "alice", 40)
+        await journal.append(BUTTON, 2, "bob", 10)
+
+    asyncio.run(run())
+    lines = journal_lines(journal)
+    asyncio.run(journal.replay())
+
+    # A crash between the INSERT and the file rewrite leaves the lines behind
+    with open(journal.path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    reloaded = make_journal(tmp_path, rolls)
+    assert reloaded.backlog() == 2
+    asyncio.run(reloaded.replay())
+
+    assert rolls.rows == {(BUTTON, 1): 40, (BUTTON, 2): 10}
+    assert reloaded.dropped == 2
+    assert journal_lines(reloaded) == []
+
+def test_failed_replay_keeps_the_backlog(tmp_path):
+    rolls = FakeRolls([BUTTON])
+    journal = make_journal(tmp_path, rolls)
+    asyncio.run(journal.append(BUTTON, 1, "alice", 40))
+
+    rolls.fail = True
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(journal.replay())
+    assert journal.backlog() == 1
+    assert not journal.draining
+
+    rolls.fail = False
+    asyncio.run(journal.replay())
+    assert rolls.rows == {(BUTTON, 1): 40}
+    assert journal.backlog() == 0
+
+def test_load_skips_a_torn_last_line(tmp_path):
+    rolls = FakeRolls([BUTTON])
+    journal = make_journal(tmp_path, rolls)
+    asyncio.run(journal.append(BUTTON, 1, "alice", 40))
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"button_id": "')
+
+    reloaded = make_journal(tmp_path, rolls)
+    assert reloaded.backlog() == 1
+    assert (BUTTON, 1) in reloaded.keys
+
+
+@pytest.fixture
+def journal_enabled(tmp_path, monkeypatch):
+    journal = make_journal(tmp_path, FakeRolls([BUTTON]))
+    monkeypatch.setattr(db.operations, "roll_journal", journal)
+    roll_cache.invalidate(BUTTON)
+    return journal
+
+def test_unchecked_journal_roll_is_pending(journal_enabled):
+    inserted, _ = asyncio.run(db.operations.journal_roll(BUTTON, 1, "alice", 40))
+    assert inserted["pending"]
+
+def test_checked_journal_roll_refuses_a_roll_the_database_has(journal_enabled, monkeypatch):
+    async def get_roll_status(button_id, user_id):
+        return True, user_id == 1
+    monkeypatch.setattr(db.operations, "get_roll_status", get_roll_status)
+
+    duplicate, _ = asyncio.run(db.operations.journal_roll(BUTTON, 1, "alice", 40, check=True))
+    fresh, _ = asyncio.run(db.operations.journal_roll(BUTTON, 2, "bob", 10, check=True))
+    assert duplicate is None
+    assert not fresh["pending"]
+    assert journal_enabled.backlog() == 1
+
+def test_checked_journal_roll_is_pending_when_the_check_fails(journal_enabled, monkeypatch):
+    async def get_roll_status(button_id, user_id):
+        raise ConnectionRefusedError("database is down")
+    monkeypatch.setattr(db.operations, "get_roll_status", get_roll_status)
+
+    inserted, _ = asyncio.run(db.operations.journal_roll(BUTTON, 1, "alice", 40, check=True))
+    assert inserted["pending"]
+
+def test_record_roll_does_not_journal_after_a_timeout(journal_enabled, monkeypatch):
+    async def record_roll_in_db(*args):
+        raise asyncio.TimeoutError()
+    monkeypatch.setattr(db.operations, "record_roll_in_db", record_roll_in_db)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(db.operations.record_roll(BUTTON, 1, "alice", 40))
+    assert journal_enabled.backlog() == 0
@@ -0,0 +1,69 @@
+import asyncio
+import time
+from utils.rate_limiter import RateLimiter, TokenBucket
+
+HEADERS = {"X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "0.05"}
+
+
+def test_acquire_serves_waiters_in_arrival_order():
+    limiter = RateLimiter(50)  # one token every 20ms once the burst is spent
+    limiter.bucket.tokens = 0
+    served = []
+
+    async def caller(i):
+        await limiter.acquire()
+        served.append(i)
+
+    async def run():
+        tasks = []
+        for i in range(5):
+            tasks.append(asyncio.create_task(caller(i)))
+            await asyncio.sleep(0)  # let each caller queue before the next arrives
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert served == [0, 1, 2, 3, 4]
+    assert limiter.total_operations == 5
+
+def test_acquire_spaces_calls_at_the_refill_rate():
+    limiter = RateLimiter(50)
+    limiter.bucket.tokens = 0
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    # Three tokens at 50/s take about 60ms, not a whole window
+    assert 0.05 <= asyncio.run(run()) < 0.5
+
+def test_drain_blocks_the_bucket_for_retry_after():
+    bucket = TokenBucket(1000, 1000)
+    bucket.drain(0.5)
+    assert bucket.delay(time.monotonic()) > 0.4
+
+def test_route_bucket_is_learned_from_headers_and_waited_on():
+    limiter = RateLimiter(1000)
+    limiter.update_from_headers("channel:1", HEADERS)
+    assert limiter.route_buckets["channel:1"].capacity == 5
+
+    async def run():
+        start = time.monotonic()
+        await limiter.acquire("channel:1")
+        return time.monotonic() - start
+
+    # The route had no requests left, so the call waits for its reset
+    assert asyncio.run(run()) >= 0.04
+
+def test_headers_without_rate_limit_fields_are_ignored():
+    limiter = RateLimiter(1000)
+    limiter.update_from_headers("channel:1", {"Content-Type": "application/json"})
+    assert "channel:1" not in limiter.route_buckets
+
+def test_share_scales_the_global_budget():
+    limiter = RateLimiter(40)
+    limiter.set_share(0.25)
+    assert limiter.bucket.rate == 10
+    assert limiter.bucket.capacity == 10
+    assert limiter.bucket.tokens <= 10
@@ -0,0 +1,84 @@
+import asyncio
+import uuid
+import pytest
+import db.operations
+from db.cache import roll_cache
+from ui.roll_button import schedule_refresh
+from ui.roll_renderer import CLOSED_SUFFIX
+from utils.edit_scheduler import edit_scheduler
+
+BUTTON = uuid.uuid4()
+
+
+class FakeChannel:
+    id = 1
+
+
+class FakeMessage:
+    channel = FakeChannel()
+
+    def __init__(self):
+        self.edits = []  # (content, view) in the order they landed
+
+    async def edit(self, content=None, view=None):
+        await asyncio.sleep(0.01)
+        self.edits.append((content, view))
+
+
+@pytest.fixture
+def button(monkeypatch):
+    state = {"open": True}
+
+    async def get_rolls(button_id):
+        return [{"user_id": 1, "user_display_name": "alice", "roll": 40, "timestamp": None}]
+
+    async def is_button_open(button_id):
+        return state["open"]
+
+    monkeypatch.setattr(db.operations, "get_rolls", get_rolls)
+    monkeypatch.setattr(db.operations, "is_button_open", is_button_open)
+    monkeypatch.setattr(edit_scheduler, "interval", 0.02)
+    roll_cache.invalidate(BUTTON)
+    return state
+
+
+def test_close_replaces_a_pending_refresh(button):
+    message = FakeMessage()
+
+    async def run():
+        first = schedule_refresh(BUTTON, message)
+        await asyncio.sleep(0)
+        # A roll refresh is waiting behind the first edit when the button closes
+        schedule_refresh(BUTTON, message)
+        button["open"] = False
+        closed = schedule_refresh(BUTTON, message, is_open=False)
+        await asyncio.gather(first, closed)
+
+    asyncio.run(run())
+    content, view = message.edits[-1]
+    assert content.endswith(CLOSED_SUFFIX)
+    assert view is None
+    assert len(message.edits) == 2
+
+def test_a_refresh_after_a_close_keeps_the_message_closed(button):
+    message = FakeMessage()
+    button["open"] = False
+
+    async def run():
+        await schedule_refresh(BUTTON, message)
+
+    asyncio.run(run())
+    content, view = message.edits[-1]
+    assert content.endswith(CLOSED_SUFFIX)
+    assert view is None
+
+def test_an_open_button_keeps_its_roll_buttons(button):
+    message = FakeMessage()
+
+    async def run():
+        await schedule_refresh(BUTTON, message)
+
+    asyncio.run(run())
+    content, view = message.edits[-1]
+    assert not content.endswith(CLOSED_SUFFIX)
+    assert view.button_id == BUTTON
@@ -1,48 +1,62 @@
 import discord
-import pytz
 import logging
 from config import AUTHORIZED_ADMIN_IDS
-from utils.rate_limiter import rate_limiter
+from utils.metrics import track_interaction
+from utils.interaction_deadline import with_deadline, respond, edit_response
+from utils.tracing import tag
 
 logger = logging.getLogger('discord_bot')
 
+# Delete buttons per page; Discord allows 25 components and row 4 holds the controls
+ADMIN_PAGE_SIZE = 20
+
 class ConfirmDeleteButton(discord.ui.Button):
     def __init__(self):
         super().__init__(label="Confirm Delete", style=discord.ButtonStyle.danger)
     
+    @with_deadline("confirm_delete")
     async def callback(self, interaction: discord.Interaction):
         parent_view = self.view
         
         # Change the message to indicate deletion in progress
-        await interaction.response.edit_message(content="Deleting...", view=None)
+        await edit_response(interaction, content="Deleting...", view=None)
         
         # Perform the deletion
-        success = await perform_delete(
+        username = parent_view.roll_being_deleted['username']
+        result = await perform_delete(
             interaction, 
             parent_view.button_id,
             parent_view.roll_being_deleted['user_id'],
-            parent_view.roll_being_deleted['username']
+            username
         )
         
         # Update the SAME ephemeral message with the result
-        if success:
+        # No auto-disappear, admin must dismiss manually
+        if result is None:
+            await interaction.edit_original_response(content="⚠️ Failed to delete the roll.")
+            return
+        deleted, refreshed = result
+        if not deleted:
             await interaction.edit_original_response(
-                content=f"✅ Deleted roll for **{parent_view.roll_being_deleted['username']}**"
+                content=f"⚠️ **{username}** has no roll to delete - it was already removed."
             )
-            # No auto-disappear, admin must dismiss manually
-        else:
+        elif refreshed is False:
+            # The delete happened; retrying it would only find nothing to delete
             await interaction.edit_original_response(
-                content="⚠️ Failed to delete the roll."
+                content=f"✅ Deleted roll for **{username}**, but the roll message couldn't be updated yet."
             )
+        else:
+            await interaction.edit_original_response(content=f"✅ Deleted roll for **{username}**")
 
 
 class CancelDeleteButton(discord.ui.Button):
     def __init__(self):
         super().__init__(label="Cancel", style=discord.ButtonStyle.secondary)
     
+    @with_deadline("cancel_delete")
     async def callback(self, interaction: discord.Interaction):
         # Just close the message
-        await interaction.response.edit_message(content="Operation cancelled.", view=None)
+        await edit_response(interaction, content="Operation cancelled.", view=None)
 
 
 class DeleteRollButton(discord.ui.Button):
@@ -58,9 +72,10 @@ class DeleteRollButton(discord.ui.Button):
             row=row_number
         )
 
+    @with_deadline("delete_roll")
     async def callback(self, interaction: discord.Interaction):
         if interaction.user.id not in AUTHORIZED_ADMIN_IDS:
-            await interaction.response.send_message("⛔ You're not authorized to delete rolls.", ephemeral=True)
+            await respond(interaction, "⛔ You're not authorized to delete rolls.", ephemeral=True)
             return
         
         # Show confirmation in the same view
@@ -71,21 +86,134 @@ class DeleteRollButton(discord.ui.Button):
         await self.parent_view.show_delete_confirmation(interaction, roll_info)
 
 
+class PageButton(discord.ui.Button):
+    def __init__(self, label, direction, disabled):
+        self.direction = direction
+        super().__init__(label=label, style=discord.ButtonStyle.secondary, row=4, disabled=disabled)
+
+    @with_deadline("page")
+    async def callback(self, interaction: discord.Interaction):
+        await self.view.turn_page(interaction, self.direction)
+
+
+class SearchRollsModal(discord.ui.Modal, title="Find rolls"):
+    query = discord.ui.TextInput(label="User name contains", max_length=100, required=False)
+
+    def __init__(self, parent_view):
+        super().__init__()
+        self.parent_view = parent_view
+
+    @with_deadline("search")
+    async def on_submit(self, interaction: discord.Interaction):
+        self.parent_view.search = self.query.value.strip() or None
+        await self.parent_view.load_page()
+        await edit_response(interaction, view=self.parent_view)
+
+
+class SearchRollsButton(discord.ui.Button):
+    def __init__(self, searching):
+        self.searching = searching
+        super().__init__(
+            label="✖️ Clear search" if searching else "🔍 Search",
+            style=discord.ButtonStyle.primary,
+            row=4
+        )
+
+    @with_deadline("search")
+    async def callback(self, interaction: discord.Interaction):
+        if self.searching:
+            self.view.search = None
+            await self.view.load_page()
+            await edit_response(interaction, view=self.view)
+        else:
+            # A modal can't follow a deferral, but opening one needs no DB work
+            await interaction.response.send_modal(SearchRollsModal(self.view))
+
+
+class CloseRollingButton(discord.ui.Button):
+    def __init__(self):
+        super().__init__(label="🔒 Close", style=discord.ButtonStyle.danger, row=4)
+
+    @with_deadline("close")
+    async def callback(self, interaction: discord.Interaction):
+        if interaction.user.id not in AUTHORIZED_ADMIN_IDS:
+            await respond(interaction, "⛔ You're not authorized to close rolling.", ephemeral=True)
+            return
+
+        # Import here to avoid circular imports
+        from db.operations import close_button
+        from tasks.background import close_button_message
+
+        await edit_response(interaction, content="Closing...", view=None)
+        row = await close_button(self.view.button_id)
+        if row:
+            if await close_button_message(interaction.client, self.view.button_id, row["channel_id"], row["message_id"]):
+                await interaction.edit_original_response(content="🔒 Rolling closed. Rolls will be archived.")
+            else:
+                await interaction.edit_original_response(
+                    content="🔒 Rolling closed, but the roll message couldn't be updated. Clicks on it are still refused."
+                )
+        else:
+            await interaction.edit_original_response(content="⚠️ This button is already closed.")
+
+
 class AdminRollManager(discord.ui.View):
-    def __init__(self, button_id, rolls):
+    """Admin delete controls, one keyset-paginated page of rolls at a time"""
+    def __init__(self, button_id):
         super().__init__(timeout=180)
         self.button_id = button_id
         self.in_delete_confirmation_mode = False
         self.roll_being_deleted = None
-        
-        # Add delete buttons for each roll
-        for i, roll in enumerate(rolls):
-            row_num = i % 5  # Up to 5 rows
+        self.search = None
+        self.rolls = []
+        self.has_prev = False
+        self.has_next = False
+
+    @classmethod
+    async def create(cls, button_id):
+        view = cls(button_id)
+        await view.load_page()
+        return view
+
+    async def load_page(self, after=None, before=None):
+        # Import here to avoid circular imports
+        from db.operations import get_rolls_page
+
+        self.rolls, has_more = await get_rolls_page(
+            self.button_id, ADMIN_PAGE_SIZE, after=after, before=before, search=self.search
+        )
+        if before:
+            self.has_prev, self.has_next = has_more, True
+        else:
+            self.has_prev, self.has_next = after is not None, has_more
+        self.build_items()
+
+    def build_items(self):
+        self.clear_items()
+
+        # Delete buttons fill rows 0-3, navigation sits on row 4
+        for i, roll in enumerate(self.rolls):
             delete_button = DeleteRollButton(
-                self, button_id, roll["user_id"], 
-                roll["user_display_name"], row_number=row_num
+                self, self.button_id, roll["user_id"],
+                roll["user_display_name"], row_number=i // 5
             )
             self.add_item(delete_button)
+
+        self.add_item(PageButton("◀️ Prev", "prev", disabled=not self.has_prev))
+        self.add_item(PageButton("Next ▶️", "next", disabled=not self.has_next))
+        self.add_item(SearchRollsButton(searching=self.search is not None))
+        self.add_item(CloseRollingButton())
+
+    async def turn_page(self, interaction, direction):
+        if direction == "next" and self.rolls:
+            last = self.rolls[-1]
+            await self.load_page(after=(last["timestamp"], last["id"]))
+        elif direction == "prev" and self.rolls:
+            first = self.rolls[0]
+            await self.load_page(before=(first["timestamp"], first["id"]))
+        else:
+            await self.load_page()
+        await edit_response(interaction, view=self)
     
     # New method to switch to confirmation mode
     async def show_delete_confirmation(self, interaction, roll_info):
@@ -100,74 +228,41 @@ class AdminRollManager(discord.ui.View):
         self.add_item(CancelDeleteButton())
         
         # Update the message with confirmation text
-        await interaction.response.edit_message(
+        await edit_response(
+            interaction,
             content=f"⚠️ Are you sure you want to delete the roll for **{roll_info['username']}**?",
             view=self
         )
 
 
+@track_interaction("delete")
 async def perform_delete(interaction, button_id, user_id, username):
+    """Delete a user's roll and refresh the public message.
+
+    Returns (deleted, refreshed), or None if the delete itself failed.
+    deleted is False when there was no roll to delete; refreshed is the
+    message edit's outcome, None when no edit was needed.
+    """
     # Import here to avoid circular imports
-    from db.operations import delete_roll, get_message_info, get_rolls
+    from db.operations import delete_roll_and_get_state
+    from ui.roll_button import schedule_refresh
     
+    tag(button_id=button_id, user_id=user_id)
     try:
-        # Step 1: Delete from DB
-        await delete_roll(button_id, user_id)
-
-        # Step 2: Get message and channel IDs
-        msg_row = await get_message_info(button_id)
-        if not msg_row:
-            return False
-
-        channel_id = msg_row["channel_id"]
-        message_id = msg_row["message_id"]
-
-        # Step 3: Fetch updated roll list
-        updated_rolls = []
-        results = await get_rolls(button_id)
-        for r in results:
-            updated_rolls.append({
-                "user_display_name": r["user_display_name"],
-                "roll": r["roll"],
-                "timestamp": r["timestamp"]
-            })
-
-        # Step 4: Regenerate public roll message
-        if updated_rolls:
-            est = pytz.timezone("US/Eastern")
-            highest = max(updated_rolls, key=lambda r: r["roll"])
-            lowest = min(updated_rolls, key=lambda r: r["roll"])
-
-            result_lines = []
-            for r in updated_rolls:
-                name, value, timestamp = r["user_display_name"], r["roll"], r["timestamp"]
-                emoji = (
-                    "👑" if (name, value) == (highest["user_display_name"], highest["roll"]) else
-                    "💀" if (name, value) == (lowest["user_display_name"], lowest["roll"]) and len(updated_rolls) > 1 else
-                    "🎲"
-                )
-                result_lines.append(f"{emoji} **{name}** rolled **{value}**")
-            new_content = "\n".join(result_lines)
-        else:
-            new_content = "🎲 No rolls yet. Be the first to click!"
-
-        # Import here to avoid circular imports
-        from ui.roll_button import RollButton
-        
-        # Step 5: Edit original roll message - with rate limiting
-        await rate_limiter.acquire()
-        channel = await interaction.client.fetch_channel(channel_id)
-        if not channel:
-            return False
-
-        await rate_limiter.acquire()
-        msg = await channel.fetch_message(message_id)
-        view = RollButton(button_id=button_id)
-        await rate_limiter.acquire()
-        await msg.edit(content=new_content, view=view)
-        
-        return True
-        
+        # Step 1: Delete from DB and get the message coordinates in one transaction
+        state = await delete_roll_and_get_state(button_id, user_id)
     except Exception as e:
         logger.error(f"Delete operation failed: {e}")
-        return False
\ No newline at end of file
+        return None
+    if not state["deleted"] or state["message_id"] is None:
+        return state["deleted"], None
+
+    # Step 2: Edit original roll message through the edit scheduler so it
+    # coalesces with any roll clicks on the same button. The stored IDs are
+    # enough for a partial message, so no channel or message fetch is needed.
+    msg = interaction.client.get_partial_messageable(state["channel_id"]).get_partial_message(state["message_id"])
+
+    # A closed button stays closed; an open one may be closed before the
+    # edit runs, so then the status is checked again at edit time
+    refreshed = await schedule_refresh(button_id, msg, is_open=None if state["is_open"] else False)
+    return True, refreshed
@@ -1,107 +1,206 @@
 import uuid
 import random
 import discord
-import pytz
 from config import AUTHORIZED_ADMIN_IDS
-from utils.rate_limiter import rate_limiter
-
-class RollButton(discord.ui.View):
-    def __init__(self, button_id=None):
-        super().__init__(timeout=None)
-        self.button_id = button_id or uuid.uuid4()
-
-    def is_authorized(self, user_id):
-        return user_id in AUTHORIZED_ADMIN_IDS
+from utils.rate_limiter import rate_limiter, handle_api_error
+from utils.edit_scheduler import edit_scheduler
+from utils.button_actors import roll_actors
+from ui.roll_renderer import render_message, format_timestamp
+from utils.metrics import track_interaction
+from utils.interaction_deadline import with_deadline, respond, defer
+from utils.tracing import span, tag
+
+
+def schedule_refresh(button_id, message, is_open=None):
+    """Queue an edit of a button's public message to its current state.
+
+    Every edit of the message goes through the edit scheduler, so a newer one
+    (a close, say) replaces any refresh still waiting. Returns the scheduler's
+    future, True once the edit landed.
+    """
+    route = f"channel:{message.channel.id}"
+
+    async def refresh():
+        content, view = await render_message(button_id, is_open)
+        await rate_limiter.acquire(route)
+        try:
+            with span("discord.edit"):
+                await message.edit(content=content, view=view)
+        except discord.HTTPException as e:
+            await handle_api_error(e, route=route)
+            raise
+
+    return edit_scheduler.schedule(button_id, refresh)
+
+def parse_button_id(match):
+    """Button ID from a custom_id match; None for legacy messages"""
+    return uuid.UUID(match["button_id"]) if match["button_id"] else None
+
+async def resolve_legacy_button_id(interaction):
+    """Messages posted before custom_ids carried the button_id use the shared
+    "roll_button"/"stats_button" ids; map them back by message.
+
+    Called from the callbacks, after the startup gate, so the lookup never
+    runs before the database is up.
+    """
+    if interaction.message is None:
+        return None
+    # Import here to avoid circular imports
+    from db.operations import get_button_id_by_message
+    return await get_button_id_by_message(interaction.message.id)
+
+
+class RollDynamicButton(discord.ui.DynamicItem[discord.ui.Button], template=r"roll(?::(?P<button_id>[0-9a-fA-F-]{36})|_button)"):
+    """Roll button for every posted message, routed by the button_id in its custom_id"""
+    def __init__(self, button_id, custom_id=None):
+        super().__init__(
+            discord.ui.Button(
+                label="🎲 CLICK HERE TO ROLL! 🎲",
+                style=discord.ButtonStyle.primary,
+                custom_id=custom_id or f"roll:{button_id}",
+                row=0
+            )
+        )
+        self.button_id = button_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        # Legacy ids keep their custom_id; the callback looks the button up
+        return cls(parse_button_id(match), custom_id=item.custom_id)
+
+    @track_interaction("roll")
+    @with_deadline("roll")
+    async def callback(self, interaction: discord.Interaction):
+        if self.button_id is None:
+            self.button_id = await resolve_legacy_button_id(interaction)
+        if self.button_id is None:
+            await respond(interaction, "⚠️ This roll button is no longer tracked.", ephemeral=True)
+            return
 
-    @discord.ui.button(label="🎲 CLICK HERE TO ROLL! 🎲", style=discord.ButtonStyle.primary, custom_id="roll_button", row=0)
-    async def roll_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Import here to avoid circular imports
-        from db.operations import has_user_rolled, save_roll, get_rolls
+        from db.operations import is_button_open, DB_UNAVAILABLE_ERRORS
         
         user_id = interaction.user.id
         user_display_name = interaction.user.display_name
+        tag(button_id=self.button_id, user_id=user_id)
 
-        if await has_user_rolled(self.button_id, user_id):
-            await interaction.response.send_message("‼️ You've already rolled on this item ‼️", ephemeral=True)
+        # Clicks on one button are recorded in order by its actor, batched with
+        # whatever queued up meanwhile; a full queue means the button is flooded
+        roll = random.randint(1, 100)
+        recorded = roll_actors.submit(self.button_id, (user_id, user_display_name, roll))
+        if recorded is None:
+            await respond(interaction, "🐢 This button is very busy right now - try again in a moment.", ephemeral=True)
+            return
+        with span("actor.wait"):
+            inserted = await recorded
+        if not inserted:
+            # Only the failure path pays for telling "closed" apart from "already rolled"
+            try:
+                is_open = await is_button_open(self.button_id)
+            except DB_UNAVAILABLE_ERRORS:
+                # During an outage the journal refused a duplicate from the cache
+                is_open = True
+            if not is_open:
+                await respond(interaction, "🔒 Rolling on this item has closed.", ephemeral=True)
+                return
+            await respond(interaction, "‼️ You've already rolled on this item ‼️", ephemeral=True)
+            return
+
+        if inserted.get("pending"):
+            # Journaled during an outage without a duplicate/closed check, so don't promise it counts
+            await respond(
+                interaction,
+                f"📝 You rolled **{inserted['roll']}** - it's saved and will be posted once the database is back, "
+                "unless you'd already rolled or rolling has closed.",
+                ephemeral=True
+            )
+        else:
+            # Acknowledge right away; the public message is refreshed by the edit
+            # scheduler, which folds a burst of clicks into one edit per interval
+            await defer(interaction)
+        schedule_refresh(self.button_id, interaction.message)
+
+
+class StatsDynamicButton(discord.ui.DynamicItem[discord.ui.Button], template=r"stats(?::(?P<button_id>[0-9a-fA-F-]{36})|_button)"):
+    """Stats button for every posted message, routed by the button_id in its custom_id"""
+    def __init__(self, button_id, custom_id=None):
+        super().__init__(
+            discord.ui.Button(
+                label="📊",
+                style=discord.ButtonStyle.secondary,
+                custom_id=custom_id or f"stats:{button_id}",
+                row=0
+            )
+        )
+        self.button_id = button_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        # Legacy ids keep their custom_id; the callback looks the button up
+        return cls(parse_button_id(match), custom_id=item.custom_id)
+
+    def is_authorized(self, user_id):
+        return user_id in AUTHORIZED_ADMIN_IDS
+
+    @track_interaction("stats")
+    @with_deadline("stats")
+    async def callback(self, interaction: discord.Interaction):
+        if self.button_id is None:
+            self.button_id = await resolve_legacy_button_id(interaction)
+        if self.button_id is None:
+            await respond(interaction, "⚠️ This roll button is no longer tracked.", ephemeral=True)
             return
 
-        roll = random.randint(1, 100)
-        await save_roll(self.button_id, user_id, user_display_name, roll)
-
-        # Apply rate limiting for fetch
-        await rate_limiter.acquire()
-        results = await get_rolls(self.button_id)
-        rolls = [(r["user_display_name"], r["roll"], r["timestamp"]) for r in results]
-
-        # Determine highest and lowest roll values
-        values = [value for _, value, _ in rolls]
-        highest_value = max(values)
-        lowest_value = min(values)
-
-        # Check for tie at the highest roll
-        top_rollers = [(name, value) for name, value, _ in rolls if value == highest_value]
-        is_tie_for_highest = len(top_rollers) > 1
-
-        result_lines = []
-        est = pytz.timezone("US/Eastern")
-
-        for name, value, timestamp in rolls:
-            if value == highest_value:
-                emoji = "⚔️" if is_tie_for_highest else "👑"
-            elif value == lowest_value and len(rolls) > 1:
-                emoji = "💀"
-            else:
-                emoji = "🎲"
-            result_lines.append(f"{emoji} **{name}** rolled **{value}**")
-
-        # Apply rate limiting before the edit
-        await rate_limiter.acquire()
-        await interaction.response.edit_message(content="\n".join(result_lines), view=self)
-
-    @discord.ui.button(label="📊", style=discord.ButtonStyle.secondary, custom_id="stats_button", row=0)
-    async def stats_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Import here to avoid circular imports
-        from db.operations import get_roll_stats, get_rolls, get_message_info
+        from db.operations import get_roll_stats, get_recent_rolls
         from ui.admin_buttons import AdminRollManager
         
         user_id = interaction.user.id
+        tag(button_id=self.button_id, user_id=user_id)
         
-        # Rate limit these operations
-        await rate_limiter.acquire()
+        # Counts, average, latest roll and message coordinates in one lookup
         stats = await get_roll_stats(self.button_id)
-        
-        await rate_limiter.acquire()
-        rolls = await get_rolls(self.button_id)
-        
-        await rate_limiter.acquire()
-        message_info = await get_message_info(self.button_id)
 
+        latest = format_timestamp(stats["latest_roll_at"]) if stats["latest_roll_at"] else "No rolls yet"
         message = (
             f"📊 **Roll Stats**\n"
             f"- Total rolls: `{stats['total_rolls']}`\n"
             f"- Average roll: `{stats['average_roll']}`\n"
-            f"- Latest roll: `{stats['latest_roll_time']}`\n"
+            f"- Latest roll: `{latest}`\n"
         )
 
         if self.is_authorized(user_id):
             message += "\n🔐 **Admin Info**\n"
             message += f"- Button ID: `{self.button_id}`\n"
             
-            if message_info:
-                message += f"- Channel ID: `{message_info['channel_id']}`\n"
-                message += f"- Message ID: `{message_info['message_id']}`\n"
+            if stats["message_id"]:
+                message += f"- Channel ID: `{stats['channel_id']}`\n"
+                message += f"- Message ID: `{stats['message_id']}`\n"
 
+            # Only admins need individual rolls, and only a page of them
+            rolls = await get_recent_rolls(self.button_id, 5)
             if rolls:
                 message += "- Recent Rolls:\n"
-                est = pytz.timezone("US/Eastern")
-                for r in rolls[-5:]:
-                    time_str = r["timestamp"].astimezone(est).strftime("%I:%M%p %m/%d/%y") if r["timestamp"] else "Unknown time"
+                for r in rolls:
+                    time_str = format_timestamp(r["timestamp"]) if r["timestamp"] else "Unknown time"
                     message += f"  • {r['user_display_name']} rolled {r['roll']} - `{time_str}`\n"
 
-            admin_view = AdminRollManager(self.button_id, rolls)
+            admin_view = await AdminRollManager.create(self.button_id)
             
-            # Rate limit the response
-            await rate_limiter.acquire()
-            await interaction.response.send_message(message, ephemeral=True, view=admin_view)
+            # Interaction responses have their own bucket, outside the global limit
+            await respond(interaction, message, ephemeral=True, view=admin_view)
         else:
-            await interaction.response.send_message(message, ephemeral=True)
\ No newline at end of file
+            await respond(interaction, message, ephemeral=True)
+
+
+class RollButton(discord.ui.View):
+    """Components for a roll message.
+
+    The view only lays out the buttons; clicks are dispatched to the dynamic
+    items registered once at startup, so no per-message state is kept.
+    """
+    def __init__(self, button_id=None):
+        super().__init__(timeout=None)
+        self.button_id = button_id or uuid.uuid4()
+        self.add_item(RollDynamicButton(self.button_id))
+        self.add_item(StatsDynamicButton(self.button_id))
@@ -0,0 +1,110 @@
+import heapq
+import pytz
+from collections import OrderedDict
+from config import ROLL_LIST_MAX_LINES, ROLL_CACHE_SIZE
+from utils.tracing import span
+
+DISCORD_MESSAGE_LIMIT = 2000
+SUMMARY_RESERVE = 100  # room kept for the "...and N more" line
+EMPTY_MESSAGE = "🎲 No rolls yet. Be the first to click!"
+CLOSED_SUFFIX = "\n🔒 **Rolling closed**"
+
+# pytz zone lookups are not free; resolve once
+EASTERN = pytz.timezone("US/Eastern")
+
+# button_id -> (state version, rendered content)
+rendered_cache = OrderedDict()
+
+def format_timestamp(timestamp):
+    return timestamp.astimezone(EASTERN).strftime("%I:%M%p %m/%d/%y")
+
+def render_rolls(rolls, max_lines=ROLL_LIST_MAX_LINES, limit=DISCORD_MESSAGE_LIMIT):
+    """Build the public leaderboard text, summarizing lists that won't fit in one message"""
+    if not rolls:
+        return EMPTY_MESSAGE
+
+    # Highest, lowest and tie count in a single pass
+    highest = lowest = rolls[0]["roll"]
+    top_count = 0
+    for r in rolls:
+        value = r["roll"]
+        if value > highest:
+            highest, top_count = value, 1
+        elif value == highest:
+            top_count += 1
+        if value < lowest:
+            lowest = value
+
+    crown = "⚔️" if top_count > 1 else "👑"
+
+    def line(r):
+        value = r["roll"]
+        if value == highest:
+            emoji = crown
+        elif value == lowest:
+            emoji = "💀"
+        else:
+            emoji = "🎲"
+        return f"{emoji} **{r['user_display_name']}** rolled **{value}**"
+
+    if len(rolls) <= max_lines:
+        content = "\n".join(line(r) for r in rolls)
+        if len(content) <= limit:
+            return content
+
+    # Too many to list: best rolls first, then a count of the rest
+    lines = []
+    length = 0
+    for r in heapq.nlargest(max_lines, rolls, key=lambda r: r["roll"]):
+        text = line(r)
+        if length + len(text) + 1 > limit - SUMMARY_RESERVE:
+            break
+        lines.append(text)
+        length += len(text) + 1
+    lines.append(f"➕ …and **{len(rolls) - len(lines)}** more rolls (lowest: **{lowest}**)")
+    return "\n".join(lines)
+
+async def render_button(button_id):
+    """Render a button's current rolls, reusing the output while its state is unchanged"""
+    # Import here to avoid circular imports
+    from db.operations import get_rolls
+    from db.cache import roll_cache
+
+    rolls = await get_rolls(button_id)
+    version = roll_cache.version(button_id)
+    key = str(button_id)
+
+    cached = rendered_cache.get(key)
+    if version is not None and cached and cached[0] == version:
+        rendered_cache.move_to_end(key)
+        return cached[1]
+
+    with span("render", rolls=len(rolls)):
+        content = render_rolls(rolls)
+    if version is not None:
+        rendered_cache[key] = (version, content)
+        rendered_cache.move_to_end(key)
+        while len(rendered_cache) > ROLL_CACHE_SIZE:
+            rendered_cache.popitem(last=False)
+    return content
+
+async def render_message(button_id, is_open=None):
+    """Content and view for a button's public message; closed buttons lose their view.
+
+    is_open=None looks the status up, so a refresh that runs after a close
+    can't put the buttons back.
+    """
+    # Import here to avoid circular imports
+    from db.operations import is_button_open, DB_UNAVAILABLE_ERRORS
+    from ui.roll_button import RollButton
+
+    content = await render_button(button_id)
+    if is_open is None:
+        try:
+            is_open = await is_button_open(button_id)
+        except DB_UNAVAILABLE_ERRORS:
+            # The journal keeps taking rolls during an outage, so keep the buttons too
+            is_open = True
+    if not is_open:
+        return content + CLOSED_SUFFIX, None
+    return content, RollButton(button_id)
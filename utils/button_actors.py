@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from utils.tracing import current_span, span
+
+logger = logging.getLogger('discord_bot')
+
+class ButtonActor:
+    def __init__(self, key, queue_size):
+        self.key = key  # as submitted, e.g. a UUID; the actors dict is keyed by str(key)
+        self.queue = asyncio.Queue(queue_size)
+        self.task = None
+
+
+class ActorExecutor:
+    """One worker and one bounded queue per button.
+
+    Work for a button is handled strictly in submission order, in batches of
+    whatever has queued up while the previous batch ran; different buttons
+    run in parallel. handler(key, items) returns one result per item. A full
+    queue rejects new work, so one runaway button can only ever hold a single
+    worker's share of the DB pool. Actors idle for idle_timeout seconds exit.
+    """
+    def __init__(self, handler, queue_size, batch_size, idle_timeout):
+        self.handler = handler
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.actors = {}  # key -> ButtonActor
+        self.submitted = 0
+        self.throttled = 0
+        self.batches = 0
+
+    def submit(self, key, item):
+        """Queue an item; returns a future for its result, or None when the button's queue is full"""
+        actor = self.actors.get(str(key))
+        if actor is None:
+            actor = self.actors[str(key)] = ButtonActor(key, self.queue_size)
+            actor.task = asyncio.create_task(self._run(str(key), actor))
+        if actor.queue.full():
+            self.throttled += 1
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        # The submitter's span rides along so batch work shows up in its trace
+        actor.queue.put_nowait((item, future, current_span.get()))
+        self.submitted += 1
+        return future
+
+    async def _run(self, key, actor):
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(actor.queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # No await between this check and the eviction, so nothing can slip in
+                    if actor.queue.empty():
+                        return
+                    continue
+
+                batch = [first]
+                while len(batch) < self.batch_size and not actor.queue.empty():
+                    batch.append(actor.queue.get_nowait())
+                self.batches += 1
+
+                # A batch is traced as part of the first click in it
+                token = current_span.set(batch[0][2])
+                try:
+                    with span("actor.batch", size=len(batch)):
+                        results = await self.handler(actor.key, [item for item, _, _ in batch])
+                except Exception as e:
+                    logger.error(f"Actor for {key} failed a batch of {len(batch)}: {e}")
+                    for _, future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                finally:
+                    current_span.reset(token)
+
+                for (_, future, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            if self.actors.get(key) is actor:
+                del self.actors[key]
+
+    def get_stats(self):
+        return {
+            "active": len(self.actors),
+            "queued": sum(actor.queue.qsize() for actor in self.actors.values()),
+            "submitted": self.submitted,
+            "batches": self.batches,
+            "throttled": self.throttled
+        }
+
+async def record_roll_clicks(button_id, clicks):
+    # Import here to avoid circular imports
+    from db.operations import record_rolls
+    return await record_rolls(button_id, clicks)
+
+# Create a global roll click executor instance
+from config import ACTOR_QUEUE_SIZE, ACTOR_BATCH_SIZE, ACTOR_IDLE_TIMEOUT
+roll_actors = ActorExecutor(record_roll_clicks, ACTOR_QUEUE_SIZE, ACTOR_BATCH_SIZE, ACTOR_IDLE_TIMEOUT)
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from utils.tracing import current_span, span
+
+logger = logging.getLogger('discord_bot')
+
+class EditScheduler:
+    """Coalesces message edits per key so each message is edited at most once per interval.
+
+    Callers hand in a zero-argument coroutine function that renders and applies
+    the latest state. The first edit for a key runs immediately; edits requested
+    while one is in flight or cooling down replace each other, and only the
+    newest one runs when the interval expires.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}  # key -> (newest edit coroutine function, span of the interaction asking for it)
+        self.waiters = {}  # key -> futures resolved by the next flush
+        self.workers = {}  # key -> flush task
+        self.requested = 0
+        self.performed = 0
+        self.failed = 0
+
+    def schedule(self, key, edit):
+        """Queue an edit; the returned future resolves to True once it (or a newer one) succeeded"""
+        key = str(key)
+        self.requested += 1
+        self.pending[key] = (edit, current_span.get())
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, []).append(future)
+        if key not in self.workers:
+            self.workers[key] = asyncio.create_task(self._flush_loop(key))
+        return future
+
+    async def _flush_loop(self, key):
+        try:
+            while key in self.pending:
+                edit, parent = self.pending.pop(key)
+                waiters = self.waiters.pop(key, [])
+                # Trace the edit as part of the newest interaction it serves
+                token = current_span.set(parent)
+                try:
+                    with span("edit_scheduler.edit", coalesced=len(waiters)):
+                        await edit()
+                    success = True
+                except Exception as e:
+                    logger.error(f"Scheduled edit for {key} failed: {e}")
+                    self.failed += 1
+                    success = False
+                finally:
+                    current_span.reset(token)
+                self.performed += 1
+
+                for future in waiters:
+                    if not future.done():
+                        future.set_result(success)
+
+                # Cool down; anything scheduled meanwhile is folded into one edit
+                await asyncio.sleep(self.interval)
+        finally:
+            self.workers.pop(key, None)
+
+    def get_stats(self):
+        return {
+            "requested": self.requested,
+            "performed": self.performed,
+            "failed": self.failed,
+            "active": len(self.workers)
+        }
+
+# Create a global edit scheduler instance
+from config import EDIT_COALESCE_INTERVAL
+edit_scheduler = EditScheduler(EDIT_COALESCE_INTERVAL)
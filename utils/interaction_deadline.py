@@ -0,0 +1,123 @@
+import asyncio
+import discord
+import functools
+import logging
+from config import INTERACTION_DEFER_AFTER, INTERACTION_DB_TIMEOUT, STARTUP_CLICK_WAIT
+from utils.metrics import interaction_deferrals, interaction_timeouts, db_call_timeout
+from utils.startup import startup, STARTING_UP_MESSAGE
+from utils.tracing import span
+
+logger = logging.getLogger('discord_bot')
+
+class InteractionDeadline:
+    """Acknowledges an interaction before Discord's 3 second limit runs out.
+
+    If the callback hasn't responded INTERACTION_DEFER_AFTER seconds after the
+    click was made, the watchdog defers it. Responses go through
+    respond()/edit_response(), which switch to followups once the interaction
+    is acknowledged; the lock keeps the watchdog and the callback from
+    acknowledging it twice.
+    """
+    def __init__(self, interaction, name):
+        self.interaction = interaction
+        self.name = name
+        self.lock = asyncio.Lock()
+        self.auto_deferred = False
+        self.watchdog = None
+
+    def start(self):
+        self.watchdog = asyncio.create_task(self._watch())
+
+    def stop(self):
+        if self.watchdog:
+            self.watchdog.cancel()
+
+    async def _watch(self):
+        # Discord's clock started when the click was made, not when we got to it
+        age = (discord.utils.utcnow() - self.interaction.created_at).total_seconds()
+        await asyncio.sleep(min(max(INTERACTION_DEFER_AFTER - age, 0), INTERACTION_DEFER_AFTER))
+        await self.defer(automatic=True)
+
+    async def defer(self, automatic=False):
+        async with self.lock:
+            if self.interaction.response.is_done():
+                return
+            with span("discord.defer", automatic=automatic):
+                await self.interaction.response.defer()
+            if automatic:
+                self.auto_deferred = True
+                interaction_deferrals.inc(interaction=self.name)
+                logger.debug(f"Auto-deferred slow {self.name} interaction")
+
+    async def send(self, content=None, **kwargs):
+        async with self.lock:
+            with span("discord.respond"):
+                if self.interaction.response.is_done():
+                    await self.interaction.followup.send(content, **kwargs)
+                else:
+                    await self.interaction.response.send_message(content, **kwargs)
+
+    async def edit(self, **kwargs):
+        async with self.lock:
+            with span("discord.respond"):
+                if self.interaction.response.is_done():
+                    await self.interaction.edit_original_response(**kwargs)
+                else:
+                    await self.interaction.response.edit_message(**kwargs)
+
+
+def with_deadline(name):
+    """Decorator for button/modal callbacks taking (self, interaction).
+
+    Starts the deferral watchdog, holds the click for up to STARTUP_CLICK_WAIT
+    while the database comes up (turning it away if it doesn't), and bounds
+    every DB query made by the callback to INTERACTION_DB_TIMEOUT. A query
+    that times out gets the user a short "try again" instead of Discord's
+    "This interaction failed".
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, interaction, *args, **kwargs):
+            deadline = InteractionDeadline(interaction, name)
+            interaction.extras["deadline"] = deadline
+            token = db_call_timeout.set(INTERACTION_DB_TIMEOUT)
+            deadline.start()
+            try:
+                # The watchdog is already running, so waiting here can't cost the 3s window
+                if not await startup.wait_ready(STARTUP_CLICK_WAIT):
+                    await deadline.send(STARTING_UP_MESSAGE, ephemeral=True)
+                    return
+                return await func(self, interaction, *args, **kwargs)
+            except asyncio.TimeoutError:
+                interaction_timeouts.inc(interaction=name)
+                logger.warning(f"{name} interaction timed out waiting for the database")
+                await deadline.send("⏳ That took too long - please try again in a moment.", ephemeral=True)
+            finally:
+                deadline.stop()
+                db_call_timeout.reset(token)
+        return wrapper
+    return decorator
+
+async def respond(interaction, content=None, **kwargs):
+    """send_message that becomes a followup if the interaction was already acknowledged"""
+    deadline = interaction.extras.get("deadline")
+    if deadline:
+        await deadline.send(content, **kwargs)
+    else:
+        await interaction.response.send_message(content, **kwargs)
+
+async def edit_response(interaction, **kwargs):
+    """edit_message that edits the original response if the interaction was already acknowledged"""
+    deadline = interaction.extras.get("deadline")
+    if deadline:
+        await deadline.edit(**kwargs)
+    else:
+        await interaction.response.edit_message(**kwargs)
+
+async def defer(interaction):
+    """Acknowledge the interaction unless the watchdog or a response already did"""
+    deadline = interaction.extras.get("deadline")
+    if deadline:
+        await deadline.defer()
+    elif not interaction.response.is_done():
+        await interaction.response.defer()
@@ -0,0 +1,127 @@
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import logging
+import datetime
+import logging.handlers
+
+class DropCounter:
+    def __init__(self):
+        self.queue_full = 0  # records lost because the listener thread fell behind
+        self.rate_limited = 0  # records suppressed by RateLimitFilter
+
+# Create a global dropped-record counter instance
+dropped = DropCounter()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        return json.dumps(entry)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most burst records per call site every interval seconds.
+
+    Messages are f-strings, so a call site (file and line) stands in for the
+    message template. Errors always pass. The first record after a quiet
+    period carries the number suppressed before it.
+    """
+    def __init__(self, interval, burst):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.sites = {}  # (pathname, lineno) -> [window_start, count, suppressed]
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+
+        now = time.monotonic()
+        site = self.sites.get((record.pathname, record.lineno))
+        if site is None or now - site[0] >= self.interval:
+            suppressed = site[2] if site else 0
+            self.sites[(record.pathname, record.lineno)] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+                record.msg = f"{record.msg} (suppressed {suppressed} similar messages)"
+            return True
+
+        site[1] += 1
+        if site[1] <= self.burst:
+            return True
+        site[2] += 1
+        dropped.rate_limited += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops and counts records instead of blocking when the queue is full"""
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped.queue_full += 1
+
+    def prepare(self, record):
+        # Resolve the message and traceback now; args may change before the listener gets to them
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_trace_log(path, max_bytes, backup_count):
+    """Write slow interaction traces to a rotating JSON-lines file, off the event loop"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    output = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    output.setFormatter(logging.Formatter("%(message)s"))
+
+    trace_logger = logging.getLogger('discord_bot.traces')
+    trace_logger.handlers[:] = [DroppingQueueHandler(queue.Queue(1000))]
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+    listener = logging.handlers.QueueListener(trace_logger.handlers[0].queue, output)
+    listener.start()
+    return listener
+
+def setup_logging(level, log_format, queue_size, rate_interval, rate_burst):
+    """Route all logging through a queue drained by a background thread.
+
+    The event loop only formats the message and enqueues it; stream writes
+    happen on the listener thread. Returns the started QueueListener.
+    """
+    output = logging.StreamHandler(sys.stderr)
+    if log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    handler = DroppingQueueHandler(queue.Queue(queue_size))
+    handler.addFilter(RateLimitFilter(rate_interval, rate_burst))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,124 @@
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+from collections import Counter
+from utils.metrics import event_loop_lag, event_loop_stalls
+
+logger = logging.getLogger('discord_bot')
+
+# Cumulative profile entries only count the bot's own code; the loop machinery
+# below it would otherwise top the list at 100%
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class LoopWatchdog:
+    """Measures event loop lag and catches whatever is blocking the loop.
+
+    beat() runs on the loop every interval seconds; how late it runs is the
+    lag. A daemon thread watches the heartbeat, and when the loop has been
+    stuck for threshold seconds it logs the loop thread's current stack,
+    i.e. the code that is blocking it, once per stall.
+    """
+    def __init__(self, interval, threshold):
+        self.interval = interval
+        self.threshold = threshold
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.thread = None
+        self.max_lag = 0.0  # since the last get_stats()
+        self.stalls = 0
+
+    def start(self):
+        """Call from the event loop thread"""
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self.thread.start()
+
+    def beat(self):
+        now = time.monotonic()
+        lag = max(now - self.heartbeat - self.interval, 0.0)
+        self.heartbeat = now
+        self.max_lag = max(self.max_lag, lag)
+        event_loop_lag.observe(lag)
+        if lag >= self.threshold:
+            logger.warning(f"Event loop lagged {lag * 1000:.0f}ms")
+
+    def _watch(self):
+        reported = None
+        while True:
+            time.sleep(self.threshold / 2)
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or reported == heartbeat:
+                continue
+
+            reported = heartbeat
+            self.stalls += 1
+            event_loop_stalls.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "  (loop thread not found)\n"
+            logger.warning(f"Event loop blocked for {stalled * 1000:.0f}ms so far, loop thread is at:\n{stack}")
+
+    def get_stats(self):
+        """Lag counters; max_lag resets on every call"""
+        stats = {"max_lag": self.max_lag, "stalls": self.stalls}
+        self.max_lag = 0.0
+        return stats
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}"
+
+def sample_profile(thread_id, seconds, interval=0.005):
+    """Sample thread_id's stack every interval for seconds; blocking, run it in a thread.
+
+    Returns (samples, idle, own, total): own counts the innermost frame of
+    each busy sample, total every bot function on its stack once.
+    """
+    own = Counter()
+    total = Counter()
+    samples = idle = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            samples += 1
+            # Waiting in the selector means the loop had nothing to run
+            if os.path.basename(frame.f_code.co_filename) == "selectors.py":
+                idle += 1
+            else:
+                own[frame_label(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    filename = frame.f_code.co_filename
+                    key = f"{os.path.relpath(filename, PROJECT_ROOT)} {frame.f_code.co_name}"
+                    own_code = filename.startswith(PROJECT_ROOT) and "site-packages" not in filename
+                    if own_code and not filename.endswith("main.py") and key not in seen:
+                        seen.add(key)
+                        total[key] += 1
+                    frame = frame.f_back
+        time.sleep(interval)
+    return samples, idle, own, total
+
+def format_profile(seconds, samples, idle, own, total, top=10):
+    """Compact report of a sample_profile() run, sized for a Discord message"""
+    if not samples:
+        return "No samples collected."
+    busy = samples - idle
+    lines = [f"Sampled the event loop {samples} times over {seconds}s - {busy / samples:.0%} busy"]
+    if busy:
+        lines.append("\nTop functions by own time:")
+        lines.extend(f"{count / samples:6.1%}  {label}" for label, count in own.most_common(top))
+    if total:
+        lines.append("\nTop bot functions including callees:")
+        lines.extend(f"{count / samples:6.1%}  {label}" for label, count in total.most_common(top))
+    return "```\n" + "\n".join(lines)[:1900] + "\n```"
+
+# Create a global loop watchdog instance
+from config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD_MS
+loop_watchdog = LoopWatchdog(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD_MS / 1000)
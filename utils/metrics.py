@@ -0,0 +1,316 @@
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+from config import SLOW_INTERACTION_THRESHOLD_MS
+from utils.tracing import span, trace
+
+logger = logging.getLogger('discord_bot')
+
+# Seconds; tuned for interactions that must answer within Discord's 3s window
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Gauge (or externally kept counter) read from a callback at scrape time.
+
+    The callback returns either a number or a dict of label-value tuple -> number.
+    """
+    def __init__(self, name, help_text, callback, labelnames=(), metric_type="gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.labelnames = labelnames
+        self.metric_type = metric_type
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} failed: {e}")
+            return lines
+        if value is None:
+            return lines
+        values = value if isinstance(value, dict) else {(): value}
+        for key, v in values.items():
+            lines.append(f"{self.name}{format_labels(self.labelnames, key)} {format_value(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.series = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labelnames, key, ("le", format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+interaction_latency = registry.register(Histogram(
+    "rngesus_interaction_seconds", "Time spent handling an interaction", ("interaction",)
+))
+interaction_errors = registry.register(Counter(
+    "rngesus_interaction_errors_total", "Interactions that raised", ("interaction",)
+))
+db_query_latency = registry.register(Histogram(
+    "rngesus_db_query_seconds", "Time spent in a db.operations query", ("query",)
+))
+db_pool_acquire_wait = registry.register(Histogram(
+    "rngesus_db_pool_acquire_seconds", "Time spent waiting for a pooled connection"
+))
+db_pool_failed_acquires = registry.register(Counter(
+    "rngesus_db_pool_failed_acquires_total", "Pool acquisitions that failed or timed out"
+))
+rate_limiter_wait = registry.register(Histogram(
+    "rngesus_rate_limiter_wait_seconds", "Time spent waiting for a rate limit token"
+))
+interaction_deferrals = registry.register(Counter(
+    "rngesus_interaction_deferrals_total", "Interactions auto-deferred to beat Discord's deadline", ("interaction",)
+))
+interaction_timeouts = registry.register(Counter(
+    "rngesus_interaction_timeouts_total", "Interactions abandoned after a DB call timed out", ("interaction",)
+))
+event_loop_lag = registry.register(Histogram(
+    "rngesus_event_loop_lag_seconds", "How late the loop watchdog's heartbeat ran"
+))
+event_loop_stalls = registry.register(Counter(
+    "rngesus_event_loop_stalls_total", "Times the event loop was blocked past the lag threshold"
+))
+
+# Per-query timeout while handling an interaction; set by utils.interaction_deadline
+db_call_timeout = contextvars.ContextVar("db_call_timeout", default=None)
+
+def track_interaction(name):
+    """Decorator recording latency and errors of an async interaction handler.
+
+    The handler also runs as a trace; slow ones have their span tree logged.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with trace(name, SLOW_INTERACTION_THRESHOLD_MS / 1000):
+                    return await func(*args, **kwargs)
+            except Exception:
+                interaction_errors.inc(interaction=name)
+                raise
+            finally:
+                interaction_latency.observe(time.perf_counter() - start, interaction=name)
+        return wrapper
+    return decorator
+
+def timed_query(func):
+    """Decorator recording the latency of an async db.operations query.
+
+    Inside an interaction the query is also bounded by db_call_timeout.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        timeout = db_call_timeout.get()
+        try:
+            with span(f"db.{func.__name__}"):
+                if timeout:
+                    return await asyncio.wait_for(func(*args, **kwargs), timeout)
+                return await func(*args, **kwargs)
+        finally:
+            db_query_latency.observe(time.perf_counter() - start, query=func.__name__)
+    return wrapper
+
+def register_runtime_gauges(bot):
+    """Gauges read from live objects at scrape time"""
+    # Import here to avoid circular imports
+    from utils.rate_limiter import rate_limiter
+    from utils.edit_scheduler import edit_scheduler
+    from db.cache import roll_cache
+    from utils.button_actors import roll_actors
+    from db.journal import roll_journal
+    from db.batch_writer import roll_writer
+    from utils.log_pipeline import dropped as log_dropped
+    import db.connection
+
+    registry.register(Gauge(
+        "rngesus_rate_limiter_queued", "Callers waiting for a rate limit token",
+        lambda: rate_limiter.waiting
+    ))
+    registry.register(Gauge(
+        "rngesus_rate_limiter_requests_total", "Rate limited requests since startup",
+        lambda: rate_limiter.total_operations, metric_type="counter"
+    ))
+    registry.register(Gauge(
+        "rngesus_db_pool_connections", "Database pool connections by state",
+        lambda: pool_usage(getattr(bot, "db_pool", None)), ("state",)
+    ))
+    registry.register(Gauge(
+        "rngesus_db_replica_pool_connections", "Read replica pool connections by state",
+        lambda: pool_usage(db.connection.replica_pool), ("state",)
+    ))
+    registry.register(Gauge(
+        "rngesus_db_replica_lag_seconds", "Read replica replay lag, absent while unreachable",
+        lambda: db.connection.replica_lag
+    ))
+    registry.register(Gauge(
+        "rngesus_gateway_latency_seconds", "Discord gateway heartbeat latency",
+        lambda: bot.latency if bot.latency == bot.latency else None  # NaN before the first heartbeat
+    ))
+    registry.register(Gauge(
+        "rngesus_message_edits_total", "Public message edits requested and performed",
+        lambda: {("requested",): edit_scheduler.requested, ("performed",): edit_scheduler.performed},
+        ("kind",), metric_type="counter"
+    ))
+    registry.register(Gauge(
+        "rngesus_roll_cache_lookups_total", "Roll cache lookups by result",
+        lambda: {("hit",): roll_cache.hits, ("miss",): roll_cache.misses},
+        ("result",), metric_type="counter"
+    ))
+    registry.register(Gauge(
+        "rngesus_button_actors", "Buttons with a live click actor",
+        lambda: roll_actors.get_stats()["active"]
+    ))
+    registry.register(Gauge(
+        "rngesus_button_actor_queued", "Roll clicks waiting in actor queues",
+        lambda: roll_actors.get_stats()["queued"]
+    ))
+    registry.register(Gauge(
+        "rngesus_button_actor_clicks_total", "Roll clicks by outcome at the actor queue",
+        lambda: {("queued",): roll_actors.submitted, ("throttled",): roll_actors.throttled},
+        ("outcome",), metric_type="counter"
+    ))
+    registry.register(Gauge(
+        "rngesus_button_actor_batches_total", "Click batches handled by button actors",
+        lambda: roll_actors.get_stats()["batches"], metric_type="counter"
+    ))
+    registry.register(Gauge(
+        "rngesus_roll_journal_backlog", "Journaled rolls not yet replayed into the database",
+        lambda: roll_journal.backlog() if roll_journal else None
+    ))
+    registry.register(Gauge(
+        "rngesus_roll_journal_rolls_total", "Journaled rolls: written, replayed, and dropped at replay",
+        lambda: stats_values(roll_journal.get_stats(), ("journaled", "replayed", "dropped")) if roll_journal else None,
+        ("kind",), metric_type="counter"
+    ))
+    registry.register(Gauge(
+        "rngesus_log_records_dropped_total", "Log records dropped by reason",
+        lambda: {("queue_full",): log_dropped.queue_full, ("rate_limited",): log_dropped.rate_limited},
+        ("reason",), metric_type="counter"
+    ))
+    registry.register(Gauge(
+        "rngesus_roll_cache_buttons", "Buttons held in the roll cache",
+        lambda: len(roll_cache.entries)
+    ))
+    registry.register(Gauge(
+        "rngesus_roll_batch_writes_total", "Group-committed roll inserts: flushes and rows written",
+        lambda: stats_values(roll_writer.get_stats(), ("batches", "rows")) if roll_writer else None,
+        ("kind",), metric_type="counter"
+    ))
+    registry.register(Gauge(
+        "rngesus_roll_batch_pending", "Roll inserts waiting for the next group commit",
+        lambda: roll_writer.get_stats()["pending"] if roll_writer else None
+    ))
+
+def stats_values(stats, keys):
+    """Labelled gauge values picked from a get_stats() dict"""
+    return {(key,): stats[key] for key in keys}
+
+def pool_usage(pool):
+    if pool is None:
+        return None
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return {("in_use",): size - idle, ("idle",): idle, ("max",): pool.get_max_size()}
+
+async def start_metrics_server(host, port):
+    """Serve the registry in Prometheus text format on http://host:port/metrics"""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(
+            body=registry.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -1,60 +1,178 @@
+import re
 import asyncio
-import datetime
+import time
 import logging
+from utils.metrics import rate_limiter_wait
+from utils.tracing import span
 
 logger = logging.getLogger('discord_bot')
 
+# Message edits, the only calls that go through a per-route bucket
+MESSAGE_EDIT_PATH = re.compile(r"/channels/(\d+)/messages/\d+$")
+
+class TokenBucket:
+    """Token bucket refilled continuously from a monotonic clock"""
+    def __init__(self, rate, capacity):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # set when Discord tells us the bucket is empty
+        self.lock = asyncio.Lock()  # asyncio.Lock wakes waiters in FIFO order
+
+    def refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Seconds until one token is available (0 if one is available now)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def drain(self, retry_after):
+        """Empty the bucket and block it for retry_after seconds"""
+        now = time.monotonic()
+        self.tokens = 0
+        self.updated = now
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def update(self, limit, remaining, reset_after):
+        """Resync the bucket with the state Discord reported"""
+        now = time.monotonic()
+        self.capacity = limit
+        if reset_after > 0:
+            self.rate = limit / reset_after
+        self.tokens = min(remaining, limit)
+        self.updated = now
+        if remaining <= 0:
+            self.blocked_until = max(self.blocked_until, now + reset_after)
+
+
 class RateLimiter:
     def __init__(self, max_operations_per_second, reset_time=1):
-        self.max_operations = max_operations_per_second
+        self.max_operations = max_operations_per_second * reset_time
         self.reset_time = reset_time  # in seconds
-        self.operations_count = 0
-        self.last_reset = datetime.datetime.now()
+        self.base_rate = max_operations_per_second
+        self.bucket = TokenBucket(max_operations_per_second, self.max_operations)
+        self.share = 1.0  # fraction of the bot-wide budget this process may use
+        self.route_buckets = {}  # route -> TokenBucket, learned from X-RateLimit-* headers
         self.total_operations = 0  # for tracking total usage
-    
-    async def acquire(self):
-        current_time = datetime.datetime.now()
-        time_diff = (current_time - self.last_reset).total_seconds()
-        
-        # Reset counter if reset_time has passed
-        if time_diff >= self.reset_time:
-            self.operations_count = 0
-            self.last_reset = current_time
-        
-        # Check if we're at the limit
-        if self.operations_count >= self.max_operations:
-            # Calculate wait time
-            wait_time = self.reset_time - time_diff
-            if wait_time > 0:
-                logger.warning(f"Rate limit throttling. Waiting {wait_time:.2f} seconds")
-                await asyncio.sleep(wait_time)
-                # Recursive call after waiting
-                return await self.acquire()
-        
-        # Increment counter and allow operation
-        self.operations_count += 1
+        self.waiting = 0  # callers currently queued for a token
+        self.total_wait_time = 0.0
+
+    async def _take(self, bucket):
+        # Waiters queue on the bucket lock, so each one sleeps exactly until its
+        # own token is due instead of everyone waking at the window boundary
+        async with bucket.lock:
+            delay = bucket.delay(time.monotonic())
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = bucket.delay(time.monotonic())
+            bucket.tokens -= 1
+
+    async def acquire(self, route=None):
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            with span("rate_limiter.acquire", route=route):
+                await self._take(self.bucket)
+                route_bucket = self.route_buckets.get(route) if route else None
+                if route_bucket:
+                    await self._take(route_bucket)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - start
+        rate_limiter_wait.observe(waited)
+        if waited > 0:
+            self.total_wait_time += waited
+            if waited >= self.reset_time:
+                logger.warning(f"Rate limit throttling. Waited {waited:.2f} seconds")
         self.total_operations += 1
         return True
-    
+
+    def set_share(self, fraction):
+        """Scale the global budget to this process's share of a bot shared across processes"""
+        fraction = min(max(fraction, 0.01), 1.0)
+        self.bucket.rate = self.base_rate * fraction
+        self.bucket.capacity = max(self.max_operations * fraction, 1)
+        self.bucket.tokens = min(self.bucket.tokens, self.bucket.capacity)
+        self.share = fraction
+
+    def update_from_headers(self, route, headers):
+        """Create or resync the per-route bucket from Discord's rate limit headers"""
+        try:
+            limit = int(headers["X-RateLimit-Limit"])
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_after = float(headers["X-RateLimit-Reset-After"])
+        except (KeyError, TypeError, ValueError):
+            return
+
+        bucket = self.route_buckets.get(route)
+        if bucket is None:
+            bucket = TokenBucket(limit / reset_after if reset_after > 0 else limit, limit)
+            self.route_buckets[route] = bucket
+        bucket.update(limit, remaining, reset_after)
+
     def get_usage_stats(self):
+        self.bucket.refill(time.monotonic())
         return {
-            "current_window": self.operations_count,
-            "max_per_window": self.max_operations,
-            "total_since_startup": self.total_operations
+            "current_window": int(self.bucket.capacity - max(self.bucket.tokens, 0)),
+            "max_per_window": int(self.bucket.capacity),
+            "total_since_startup": self.total_operations,
+            "queued": self.waiting,
+            "total_wait_time": self.total_wait_time,
+            "route_buckets": len(self.route_buckets),
+            "share": self.share
         }
 
 # Create a global rate limiter instance
 from config import MAX_OPERATIONS_PER_SECOND, RATE_LIMIT_RESET_TIME
 rate_limiter = RateLimiter(MAX_OPERATIONS_PER_SECOND, RATE_LIMIT_RESET_TIME)
 
-async def handle_api_error(error):
+async def handle_api_error(error, route=None):
     """Handle Discord API errors, particularly rate limiting"""
     import discord
-    
+
     if isinstance(error, discord.errors.HTTPException):
+        headers = getattr(error.response, "headers", None) or {}
+        if route:
+            rate_limiter.update_from_headers(route, headers)
+
         if error.status == 429:  # Too Many Requests
-            retry_after = error.retry_after if hasattr(error, 'retry_after') else 60
-            logger.warning(f"Rate limited by Discord. Waiting {retry_after} seconds")
-            await asyncio.sleep(retry_after)
+            retry_after = getattr(error, "retry_after", None)
+            if retry_after is None:
+                try:
+                    retry_after = float(headers.get("Retry-After", 60))
+                except (TypeError, ValueError):
+                    retry_after = 60
+
+            # Drain the bucket that was hit; the retry then waits in acquire()
+            if headers.get("X-RateLimit-Global") or route not in rate_limiter.route_buckets:
+                rate_limiter.bucket.drain(retry_after)
+                logger.warning(f"Globally rate limited by Discord. Blocking for {retry_after} seconds")
+            else:
+                rate_limiter.route_buckets[route].drain(retry_after)
+                logger.warning(f"Rate limited by Discord on {route}. Blocking for {retry_after} seconds")
             return True  # Signal that we should retry
-    return False  # Don't retry for other errors
\ No newline at end of file
+    return False  # Don't retry for other errors
+
+def rate_limit_trace():
+    """aiohttp trace for the bot's HTTP session that resyncs route buckets from every
+    message edit response, not just the failed ones handle_api_error sees"""
+    import aiohttp
+
+    async def on_request_end(session, context, params):
+        match = MESSAGE_EDIT_PATH.search(params.url.path)
+        if params.method == "PATCH" and match:
+            rate_limiter.update_from_headers(f"channel:{match.group(1)}", params.response.headers)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_end.append(on_request_end)
+    return trace
@@ -0,0 +1,58 @@
+import time
+import asyncio
+import logging
+import contextlib
+from config import STARTUP_CLICK_WAIT
+
+logger = logging.getLogger('discord_bot')
+
+STARTING_UP_MESSAGE = "⏳ RNGesus is still starting up - try again in a few seconds."
+
+class Startup:
+    """Startup stage timings and the readiness state interactions are gated on"""
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stage_times = {}  # stage -> seconds it took
+        self.db_ready = asyncio.Event()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            logger.error(f"Startup stage {name} failed after {time.monotonic() - start:.2f}s")
+            raise
+        self.stage_times[name] = time.monotonic() - start
+        logger.info(f"Startup stage {name} took {self.stage_times[name]:.2f}s " +
+                    f"({time.monotonic() - self.started:.2f}s since start)")
+
+    def mark(self, name):
+        """Record a stage that ran from process start until now (e.g. the gateway)"""
+        if name not in self.stage_times:
+            self.stage_times[name] = time.monotonic() - self.started
+            logger.info(f"Startup stage {name} took {self.stage_times[name]:.2f}s")
+
+    @property
+    def ready(self):
+        return self.db_ready.is_set()
+
+    async def wait_ready(self, timeout):
+        """Wait up to timeout seconds for the database; True once it's up"""
+        if self.db_ready.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self.db_ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+async def ensure_ready(interaction):
+    """Hold a click briefly while the database comes up, then turn it away politely"""
+    if await startup.wait_ready(STARTUP_CLICK_WAIT):
+        return True
+    await interaction.response.send_message(STARTING_UP_MESSAGE, ephemeral=True)
+    return False
+
+# Create a global startup state instance
+startup = Startup()
@@ -0,0 +1,80 @@
+import json
+import time
+import logging
+import datetime
+import contextlib
+import contextvars
+
+# Slow interaction span trees go to their own logger; see log_pipeline.setup_trace_log
+trace_logger = logging.getLogger('discord_bot.traces')
+
+# Innermost open span of the interaction being handled (None outside one)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self, origin):
+        entry = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3)
+        }
+        if self.attrs:
+            entry["attrs"] = {k: str(v) for k, v in self.attrs.items()}
+        if self.end is None:
+            entry["unfinished"] = True
+        if self.children:
+            entry["children"] = [child.to_dict(origin) for child in self.children]
+        return entry
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time a stage of the current interaction; a no-op outside one"""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        current_span.reset(token)
+
+def tag(**attrs):
+    """Attach attributes to the innermost open span"""
+    current = current_span.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+@contextlib.contextmanager
+def trace(name, threshold, **attrs):
+    """Root span for one interaction; written out if it took threshold seconds or more"""
+    root = Span(name, attrs)
+    token = current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.end = time.perf_counter()
+        current_span.reset(token)
+        if threshold and root.duration >= threshold:
+            trace_logger.info(json.dumps({
+                "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "interaction": name,
+                "duration_ms": round(root.duration * 1000, 3),
+                "trace": root.to_dict(root.start)
+            }))